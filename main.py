@@ -4,7 +4,11 @@ import datetime
 import traceback
 import csv
 import os
+import sys
+import time
+import asyncio
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Pool
 from functools import partial
 import numpy as np
@@ -12,7 +16,7 @@ from copy import deepcopy
 
 import tqdm
 
-from util import DataSources, Storage, RegexFilter, to_json, settings, to_utc, from_utc
+from util import DataSource, DataSources, Storage, ResponseCache, place_series_stats, http_pool_stats, parse_interval, Scheduler, ScheduledJob, RegexFilter, ResponseUnchanged, InfluxWriter, to_json, settings, to_utc, from_utc
 from sources import *
 
 
@@ -30,11 +34,31 @@ def parse_args():
         list: list all data sources
         load: load snapshots from disk and print
         load-stats: load snapshots from disk and print stats
+            (json and csv format also contain percentiles, occupancy and hourly/weekday profiles)
         export: print complete json data of meta and snapshots - also tests if all timestamp places are in meta data
         export-csv: export timestamp csv file to --csv-path - export timezone is UTC
             if used with --date, export single day 
             otherwise export everything until UTC yesterday that is not already exported in --csv-path
-        to-influx: load snapshots and export to influx
+        to-influxdb: export snapshots to influxdb in batches of line protocol,
+            only points newer than the last export of each place (see ./influx-state/)
+        export-parquet: write snapshots as parquet files partitioned by source and month
+            and a table of the meta data to --parquet-path (needs the pyarrow package)
+        compact: convert stored json snapshots into monthly columnar files which are preferred when loading
+        daemon: keep running and store snapshots of each source every --interval
+            or in the interval of each source, see --schedule
+        resample: aggregate snapshots into --interval buckets (last/mean/min/max per place) and store
+            them in ./rollups/, with --format csv or json the stored buckets are printed as well
+        rollup: recalculate the daily rollup tables in ./rollups/daily/ from the whole history,
+            afterwards they are updated by each 'store'
+        load-rollups: print the daily min/max/mean per place from the rollup tables
+        bench-parse: time download_snapshot_data() of each source on cached pages (see --cache)
+            with and without settings.FAST_HTML_PARSING and compare the results
+        bench: replay the cached responses (see --cache) of each source without network and print
+            time, time spent outside of reading responses and peak memory of download and transform
+            of snapshot and meta data
+        check-place-ids: transform all stored snapshot and meta files and verify that
+            DataSource.place_name_to_id returns the same ids as the original implementation
+        compress: convert all stored files to --compression (or settings.SNAPSHOT_COMPRESSION, or gzip)
         """
     )
     parser.add_argument(
@@ -62,39 +86,86 @@ def parse_args():
         "--csv-path", type=str, default="./csv-export",
         help="base directory for csv export, defaults to './csv-export'",
     )
+    parser.add_argument(
+        "--parquet-path", type=str, default="./parquet-export",
+        help="base directory for parquet export, defaults to './parquet-export'",
+    )
     parser.add_argument(
         "-c", "--cache", type=bool, nargs="?", default=False, const=True,
         help="Store websites/endpoints data in cache directory and reuse if existing",
     )
+    parser.add_argument(
+        "-j", "--concurrency", type=int, default=None,
+        help="max number of sources downloaded at the same time, "
+             "defaults to settings.DOWNLOAD_CONCURRENCY",
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=None,
+        help="number of worker processes for loading snapshots, default is no parallel loading",
+    )
+    parser.add_argument(
+        "--interval", type=str, default=None,
+        help="like '300' (seconds), '5min', '1h' or '1d'. Time between snapshots of each source "
+             "in 'daemon' mode, defaults to DataSource.poll_interval or settings.DAEMON_INTERVAL. "
+             "Bucket size for 'resample', defaults to '1h'",
+    )
+    parser.add_argument(
+        "--schedule", type=str, default="fixed", choices=["fixed", "adaptive"],
+        help="'fixed' scrapes each source in its poll_interval, 'adaptive' scrapes faster "
+             "at hours of the day when the data changed often in the past and slower otherwise",
+    )
+    parser.add_argument(
+        "--compression", type=str, default=None, choices=["gzip", "zstd"],
+        help="compression for the 'compress' command",
+    )
 
     return parser.parse_args()
 
 
-def download_source(use_cache, do_store, type, attributes):
+def download_source(use_cache, do_store, type, attributes, source=None, raise_errors=False):
+    """
+    Download (and store) snapshot or meta data of one source.
+    Errors are printed and stored.
+
+    :param source: DataSource instance to reuse, a new one is created if None
+    :param raise_errors: bool, re-raise errors after they have been stored
+    :return: the data or None
+    """
     storage = Storage()
     timestamp = datetime.datetime.now()
 
     try:
-        try:
-            source = attributes["class"](use_cache=use_cache)
-            if type == "meta":
-                data = source.download_meta_data()
-            else:
+        if source is None:
+            source = attributes["class"](use_cache=use_cache, conditional=do_store and type == "snapshot")
+        if type == "meta":
+            data = source.download_meta_data()
+        else:
+            try:
                 data = source.download_snapshot_data()
-                if not data:
-                    raise ValueError(f"No data returned from {attributes['class'].__name__}.download_{type}_data()")
+            except ResponseUnchanged as e:
+                print(f"{attributes['source_id']}: {e}")
+                source.save_http_state()
+                return None
+
+            if not data:
+                raise ValueError(f"No data returned from {attributes['class'].__name__}.download_{type}_data()")
 
-            if do_store and data:
-                storage.store(attributes["source_id"], timestamp, data, type)
+        if do_store and data:
+            storage.store(attributes["source_id"], timestamp, data, type)
+            if source.conditional:
+                source.commit_http_state()
+            if type == "snapshot":
+                update_daily_rollup(storage, source, timestamp, data)
 
-            return data
+        return data
 
-        except BaseException as e:
-            error_str = f"{attributes['source_id']}: {e.__class__.__name__}"
-            traceback_str = traceback.format_exc()
-            print(f"{error_str}\n{traceback_str}")
+    except BaseException as e:
+        error_str = f"{attributes['source_id']}: {e.__class__.__name__}"
+        traceback_str = traceback.format_exc()
+        print(f"{error_str}\n{traceback_str}")
 
-            if do_store:
+        if do_store:
+            try:
                 storage.store(
                     attributes["source_id"],
                     timestamp,
@@ -104,27 +175,275 @@ def download_source(use_cache, do_store, type, attributes):
                     },
                     "error"
                 )
+            except BaseException as e:
+                print(f"{attributes['source_id']}: {e.__class__.__name__}: {e}\n{traceback.format_exc()}")
 
-    except BaseException as e:
-        print(f"{attributes['source_id']}: {e.__class__.__name__}: {e}\n{traceback.format_exc()}")
+        if raise_errors:
+            raise
 
 
-def download_sources(sources, use_cache, do_store=False, meta=False):
+def update_daily_rollup(storage, source, timestamp, data):
+    try:
+        storage.update_daily_rollup(source.source_id, timestamp, source.transform_snapshot_data(data))
+    except Exception as e:
+        print(f"{source.source_id}: updating daily rollup failed: {e.__class__.__name__}: {e}\n{traceback.format_exc()}")
 
-    pool = Pool(len(sources.sources))
 
-    source_data_list = pool.map(
-        partial(download_source, use_cache, do_store, "meta" if meta else "snapshot"),
-        sources.sources
-    )
+def download_sources(sources, use_cache, do_store=False, meta=False, concurrency=None):
+    """
+    Download all sources concurrently in this process.
+
+    The sources' download code is blocking, so each source runs in a worker thread,
+    at most `concurrency` at a time (defaults to `settings.DOWNLOAD_CONCURRENCY`).
+    """
+    concurrency = concurrency or settings.DOWNLOAD_CONCURRENCY
+    type = "meta" if meta else "snapshot"
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        source_data_list = list(executor.map(
+            partial(download_source, use_cache, do_store, type),
+            sources.sources,
+        ))
 
     data = dict()
     for attributes, result_data in zip(sources.sources, source_data_list):
         data[attributes["source_id"]] = result_data
 
+    print_http_pool_stats()
     return data
 
 
+def print_http_pool_stats():
+    stats = http_pool_stats()
+    if stats["requests"]:
+        print(
+            f"http: {stats['requests']} requests, {stats['connections']} connections, {stats['reused']} reused,"
+            f" {len(stats['hosts'])} hosts, {stats['dns_lookups']} dns lookups, {stats['dns_cache_hits']} cached",
+            file=sys.stderr,
+        )
+
+    stats = ResponseCache.get_instance().stats
+    if stats["hits"] or stats["misses"]:
+        print(
+            f"cache: {stats['hits']} hits, {stats['misses']} misses, {stats['expired']} expired,"
+            f" {stats['evicted']} evicted",
+            file=sys.stderr,
+        )
+
+
+def run_daemon(sources, use_cache, interval=None, concurrency=None, adaptive=False):
+    """
+    Store snapshots of all sources in regular intervals until interrupted.
+    The DataSource instances (and their http sessions) are kept alive between runs.
+
+    :param interval: float, seconds between snapshots, overrides the `poll_interval` of the sources
+    :param adaptive: bool, adapt each source's interval to the change rate of its data
+    """
+    jobs = []
+    for attributes in sources.sources:
+        source = attributes["class"](use_cache=use_cache, conditional=True)
+        jobs.append(ScheduledJob(
+            name=attributes["source_id"],
+            func=partial(store_source_snapshot, use_cache, attributes, source),
+            interval=interval or source.poll_interval or settings.DAEMON_INTERVAL,
+            adaptive=adaptive,
+            min_interval=source.min_poll_interval,
+            max_interval=source.max_poll_interval,
+        ))
+
+    scheduler = Scheduler(jobs, concurrency=concurrency or settings.DOWNLOAD_CONCURRENCY)
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        print("daemon stopped")
+        print_http_pool_stats()
+
+
+def store_source_snapshot(use_cache, attributes, source):
+    """
+    Store a snapshot of the source and return its canonical data as json string,
+    or None if the data is unchanged
+    """
+    data = download_source(use_cache, True, "snapshot", attributes, source=source, raise_errors=True)
+    if data is None:
+        return None
+    try:
+        return to_json(source.transform_snapshot_data(data))
+    except Exception:
+        return to_json(data)
+
+
+def bench_parse(sources, repeat=5):
+    """
+    Print the mean time of `download_snapshot_data()` with the full and the fast html parsing.
+    Pages are downloaded once and then read from the cache directory.
+    """
+    fast_html_parsing = settings.FAST_HTML_PARSING
+    try:
+        for attributes in sources.sources:
+            source = attributes["class"](use_cache=True)
+            try:
+                source.download_snapshot_data()
+            except Exception as e:
+                print(f"{attributes['source_id']:30} {e.__class__.__name__}: {e}")
+                continue
+
+            timings, results = [], []
+            for fast in (False, True):
+                settings.FAST_HTML_PARSING = fast
+                start_time = time.perf_counter()
+                for i in range(repeat):
+                    data = source.download_snapshot_data()
+                timings.append((time.perf_counter() - start_time) / repeat)
+                results.append(data)
+
+            print(
+                f"{attributes['source_id']:30} {timings[0] * 1000:9.2f}ms full {timings[1] * 1000:9.2f}ms fast"
+                f" {timings[0] / max(timings[1], 1e-9):6.2f}x"
+                f" {'same result' if results[0] == results[1] else 'DIFFERENT RESULT'}"
+            )
+    finally:
+        settings.FAST_HTML_PARSING = fast_html_parsing
+
+
+def bench_sources(sources, format="text", repeat=3):
+    """
+    Run download and transform of snapshot and meta data of each source
+    on the cached responses and measure
+
+        time:   mean wall time in milliseconds
+        parse:  time minus the time spent in `get_url`, i.e. parsing and processing
+        peak:   peak memory allocated during one run in kilobytes, measured with tracemalloc
+
+    Sub-requests are run one after another (`settings.SUBREQUEST_CONCURRENCY = 1`),
+    so the `get_url` times of concurrent threads do not overlap.
+    """
+    import tracemalloc
+    import threading
+
+    def _timed_get_url(source, timing):
+        get_url = source.get_url
+        thread_id = threading.get_ident()
+
+        def _get_url(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return get_url(*args, **kwargs)
+            finally:
+                # only the calling thread's time is part of the wall time
+                if threading.get_ident() == thread_id:
+                    timing["get_url"] += time.perf_counter() - start_time
+
+        return _get_url
+
+    rows = []
+    subrequest_concurrency = settings.SUBREQUEST_CONCURRENCY
+    settings.SUBREQUEST_CONCURRENCY = 1
+    try:
+        for attributes in tqdm.tqdm(sources.sources, file=sys.stderr):
+            for type in ("snapshot", "meta"):
+                row = {"source_id": attributes["source_id"], "type": type}
+                rows.append(row)
+
+                def _run():
+                    source = attributes["class"](offline=True)
+                    source.get_url = _timed_get_url(source, timing)
+                    if type == "snapshot":
+                        return source.transform_snapshot_data(source.download_snapshot_data())
+                    data = source.download_meta_data()
+                    return source.transform_meta_data(data) if data else None
+
+                timing = {"get_url": 0.}
+                try:
+                    start_time = time.perf_counter()
+                    for i in range(repeat):
+                        _run()
+                    wall_time = time.perf_counter() - start_time
+                    get_url_time = timing["get_url"]
+
+                    tracemalloc.start()
+                    _run()
+                    row["peak"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                    tracemalloc.stop()
+
+                except Exception as e:
+                    if tracemalloc.is_tracing():
+                        tracemalloc.stop()
+                    row["error"] = f"{e.__class__.__name__}: {e}"
+                    continue
+
+                row["time"] = round(wall_time / repeat * 1000, 2)
+                row["parse"] = round((wall_time - get_url_time) / repeat * 1000, 2)
+    finally:
+        settings.SUBREQUEST_CONCURRENCY = subrequest_concurrency
+
+    if format == "json":
+        print(to_json(rows, indent=2))
+
+    elif format == "csv":
+        writer = csv.DictWriter(sys.stdout, ["source_id", "type", "time", "parse", "peak", "error"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    else:
+        for row in rows:
+            if row.get("error"):
+                print(f"{row['source_id']:30} {row['type']:8} {row['error']}")
+            else:
+                print(
+                    f"{row['source_id']:30} {row['type']:8} {row['time']:9.2f}ms {row['parse']:9.2f}ms parse"
+                    f" {row['peak']:10.1f}kb peak"
+                )
+
+
+def check_place_ids(sources, min_date=None, max_date=None):
+    """
+    Collect every name that is passed to `place_name_to_id` while transforming
+    the stored files and compare the result with `reference_place_name_to_id`
+    :return: int, number of mismatching names
+    """
+    storage = Storage()
+    num_names, num_mismatches = 0, 0
+
+    for attributes in tqdm.tqdm(sources.sources, file=sys.stderr):
+        source_id = attributes["source_id"]
+        source = DataSources.create(source_id)
+
+        names = set()
+        place_name_to_id = source.place_name_to_id
+
+        def _recording_place_name_to_id(place_name):
+            names.add(str(place_name))
+            return place_name_to_id(place_name)
+
+        source.place_name_to_id = _recording_place_name_to_id
+
+        for type, transform in (
+                ("snapshot", source.transform_snapshot_data),
+                ("meta", source.transform_meta_data),
+        ):
+            for file in storage.iter_snapshots(source_id, min_timestamp=min_date, max_timestamp=max_date, type=type):
+                data = file["data"]
+                # see Storage._transform_snapshot
+                if type == "snapshot" and isinstance(data, dict) and source_id in data:
+                    data = data[source_id]
+                try:
+                    transform(data)
+                except Exception as e:
+                    print(f"{file['filename']}: {e.__class__.__name__}: {e}", file=sys.stderr)
+
+        for name in sorted(names):
+            place_id = place_name_to_id(name)
+            expected_place_id = source.reference_place_name_to_id(name)
+            if place_id != expected_place_id:
+                print(f"{source_id}: {name!r} -> {place_id!r}, expected {expected_place_id!r}")
+                num_mismatches += 1
+        num_names += len(names)
+
+    print(f"{num_names} names checked, {num_mismatches} mismatches")
+    return num_mismatches
+
+
 def dump_raw_data(data, place_id_filters=None):
     data_copy = dict()
     for source_id, source_data in data.items():
@@ -145,33 +464,45 @@ def dump_raw_data(data, place_id_filters=None):
     print(json.dumps(data_copy, indent=2))
 
 
-def dump_place_id_to_timestamps(place_id_to_timestamps, place_id_filters=None, format="text"):
-    filtered_data = dict()
-    for place_id in sorted(place_id_to_timestamps):
-        if place_id_filters and not place_id_filters.matches(place_id):
-            continue
-        filtered_data[place_id] = place_id_to_timestamps[place_id]
+def dump_sources_timestamps(source_timestamps, place_id_filters=None, format="text"):
+    """
+    Print the canonical data of each source
+    :param source_timestamps: iterable of tuple (source_id, place_id_to_timestamps),
+        e.g. from `Storage.iter_sources_timestamps`
+    """
+    if format == "json":
+        print("{", end="")
+    elif format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=("place_id", "timestamp", "num_free"))
+        writer.writeheader()
 
-    if format == "text":
-        for place_id in sorted(filtered_data):
-            print(place_id)
-            for value in sorted(place_id_to_timestamps[place_id], key=lambda v: v["timestamp"]):
-                print("  ", value["timestamp"].isoformat(), ":", value["num_free"])
+    num_places = 0
+    for source_id, place_id_to_timestamps in source_timestamps:
+        for place_id in sorted(place_id_to_timestamps):
+            if place_id_filters and not place_id_filters.matches(place_id):
+                continue
+            timestamps = place_id_to_timestamps[place_id]
+
+            if format == "text":
+                print(place_id)
+                for value in sorted(timestamps, key=lambda v: v["timestamp"]):
+                    print("  ", value["timestamp"].isoformat(), ":", value["num_free"])
+
+            elif format == "json":
+                print(f"{', ' if num_places else ''}{json.dumps(place_id)}: {to_json(timestamps)}", end="")
+
+            elif format == "csv":
+                for ts in sorted(timestamps, key=lambda v: v["timestamp"]):
+                    ts = deepcopy(ts)
+                    ts["place_id"] = place_id
+                    writer.writerow(ts)
 
-    elif format == "json":
-        print(to_json(filtered_data))
+            num_places += 1
 
+    if format == "json":
+        print("}")
     elif format == "csv":
-        io = StringIO()
-        writer = csv.DictWriter(io, fieldnames=("place_id", "timestamp", "num_free"))
-        writer.writeheader()
-        for place_id in sorted(filtered_data):
-            for ts in sorted(place_id_to_timestamps[place_id], key=lambda v: v["timestamp"]):
-                ts = deepcopy(ts)
-                ts["place_id"] = place_id
-                writer.writerow(ts)
-        io.seek(0)
-        print(io.read())
+        print()
 
 
 def export_place_id_to_timestamps_csv_multiple_files(place_id_to_timestamps, place_id_filters=None):
@@ -196,13 +527,13 @@ def export_place_id_to_timestamps_csv_multiple_files(place_id_to_timestamps, pla
                 last_value = ts["num_free"]
 
 
-def export_place_id_to_timestamps_csv(place_id_to_timestamps, min_date, csv_path, place_id_filters=None):
-    filtered_data = dict()
-    for place_id in sorted(place_id_to_timestamps):
-        if place_id_filters and not place_id_filters.matches(place_id):
-            continue
-        filtered_data[place_id] = place_id_to_timestamps[place_id]
-
+def export_snapshots_csv(snapshots, min_date, csv_path, place_id_filters=None):
+    """
+    Write canonical snapshots into a csv file with one column per place
+    and one row per timestamp where any value changed
+    :param snapshots: iterable of (timestamp, source_id, canonical_data) in timestamp order,
+        e.g. from `Storage.iter_canonical`
+    """
     export_path = [csv_path]
     if min_date:
         export_path += [
@@ -216,19 +547,22 @@ def export_place_id_to_timestamps_csv(place_id_to_timestamps, min_date, csv_path
     export_path = os.path.join(*export_path)
     filename = os.path.join(export_path, filename)
 
-    if not os.path.exists(export_path):
-        os.makedirs(export_path)
+    os.makedirs(export_path, exist_ok=True)
 
     timestamp_dict = dict()
-    for place_id in sorted(filtered_data):
-        last_value = "XYZ"
-        for ts in place_id_to_timestamps[place_id]:
-            if ts["num_free"] != last_value:
-                key = to_utc(ts["timestamp"]).isoformat()
+    place_id_to_last_value = dict()
+    for timestamp, source_id, canonical_data in snapshots:
+        for data in canonical_data:
+            place_id = data["place_id"]
+            if place_id_filters and not place_id_filters.matches(place_id):
+                continue
+
+            if data["num_free"] != place_id_to_last_value.get(place_id, "XYZ"):
+                key = to_utc(timestamp).isoformat()
                 if key not in timestamp_dict:
                     timestamp_dict[key] = {"timestamp": key}
-                timestamp_dict[key][place_id] = ts["num_free"]
-            last_value = ts["num_free"]
+                timestamp_dict[key][place_id] = data["num_free"]
+            place_id_to_last_value[place_id] = data["num_free"]
 
     timestamp_rows = [
         timestamp_dict[ts]
@@ -241,7 +575,7 @@ def export_place_id_to_timestamps_csv(place_id_to_timestamps, min_date, csv_path
         print(f"exporting empty csv to {filename}")
 
     with open(filename, "w") as fp:
-        writer = csv.DictWriter(fp, fieldnames=["timestamp"] + list(filtered_data))
+        writer = csv.DictWriter(fp, fieldnames=["timestamp"] + sorted(place_id_to_last_value))
         writer.writeheader()
         writer.writerows(timestamp_rows)
 
@@ -283,51 +617,178 @@ def dump_source_to_meta(source_id_to_meta, format="text"):
             print(fp.read())
 
 
-def export_place_id_to_timestamps_influx(place_id_to_timestamps, source_id_to_meta, place_id_filters=None):
-    from influxdb import InfluxDBClient
-    client = InfluxDBClient(
-        settings.INFLUX_DB_HOST, settings.INFLUX_DB_PORT,
-        settings.INFLUX_DB_USER, settings.INFLUX_DB_PASSWORD,
-        settings.INFLUX_DB_NAME
-    )
-
-    filtered_data = dict()
-    for place_id in sorted(place_id_to_timestamps):
-        if place_id_filters and not place_id_filters.matches(place_id):
-            continue
-        filtered_data[place_id] = place_id_to_timestamps[place_id]
-
-    influx_data = convert_place_id_to_timestamps_to_influx(place_id_to_timestamps, source_id_to_meta)
-    client.create_database('parking_scraper')
-
-    client.write_points(influx_data)
-
-
-def convert_place_id_to_timestamps_to_influx(place_id_to_timestamps, source_id_to_meta):
+def export_snapshots_influx(snapshots, source_id_to_meta, writer, place_id_filters=None, complete_source_ids=None):
+    """
+    Stream canonical snapshots to influxdb, points already written before are skipped
+    :param snapshots: iterable of (timestamp, source_id, canonical_data),
+        e.g. from `Storage.iter_canonical`
+    :param writer: InfluxWriter instance
+    :param complete_source_ids: set of str, sources whose snapshots are read without gap
+        since their last export, their source watermark is advanced if no place_id_filters are given
+    """
     place_id_lookup = dict()
     for source_meta in source_id_to_meta.values():
         for place in source_meta["places"].values():
             place_id_lookup[place["place_id"]] = place
 
-    influx_data = []
-    for place_id, timestamps in place_id_to_timestamps.items():
-        meta = place_id_lookup[place_id]
+    for timestamp, source_id, canonical_data in snapshots:
+        for data in canonical_data:
+            place_id = data["place_id"]
+            if place_id_filters and not place_id_filters.matches(place_id):
+                continue
 
-        for timestamp in timestamps:
-            if timestamp["num_free"] is not None:
-                influx_data.append({
-                    "measurement": "free_parking_spaces",
-                    "tags": {
+            if data["num_free"] is not None:
+                meta = place_id_lookup.get(place_id) or {}
+                writer.add(
+                    place_id,
+                    {
                         "place_id": place_id,
-                        "place_name": meta["place_name"],
-                        "city_name": meta["city_name"],
+                        "place_name": meta.get("place_name"),
+                        "city_name": meta.get("city_name"),
                     },
-                    "time": timestamp["timestamp"].isoformat(),
-                    "fields": {
-                        "value": timestamp["num_free"]
-                    }
-                })
-    return influx_data
+                    data["num_free"],
+                    timestamp,
+                )
+
+        if not place_id_filters and complete_source_ids and source_id in complete_source_ids:
+            writer.set_source_watermark(source_id, timestamp)
+
+    writer.flush()
+    print(f"{writer.num_written} points written", file=sys.stderr)
+
+
+def influx_min_timestamps(writer, source_id_to_meta, place_id_filters=None):
+    """
+    The oldest watermark of the selected places of each source, see `InfluxWriter.min_watermark`
+    :return: dict, source_id -> datetime or None to export the whole history
+    """
+    source_id_to_min_timestamp = dict()
+    for source_id, source_meta in source_id_to_meta.items():
+        place_ids = [
+            place["place_id"]
+            for place in source_meta["places"].values()
+            if not place_id_filters or place_id_filters.matches(place["place_id"])
+        ]
+        watermark = writer.min_watermark(source_id, place_ids)
+        source_id_to_min_timestamp[source_id] = datetime.datetime.fromisoformat(watermark) if watermark else None
+    return source_id_to_min_timestamp
+
+
+def export_parquet(sources, source_id_to_meta, parquet_path, min_date=None, max_date=None, place_id_filters=None):
+    """
+    Write the canonical data to
+        <parquet_path>/snapshots/source_id=<source_id>/month=<YYYY-MM>/data.parquet
+    with columns timestamp (UTC), place_id and num_free, one month of one source at a time,
+    and the meta data of all places to <parquet_path>/meta.parquet
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("export-parquet needs the 'pyarrow' package")
+
+    os.makedirs(parquet_path, exist_ok=True)
+
+    meta_rows = []
+    for source_id, source_meta in source_id_to_meta.items():
+        for place in source_meta["places"].values():
+            if place_id_filters and not place_id_filters.matches(place["place_id"]):
+                continue
+            coordinates = place.get("coordinates") or [None, None]
+            address = place.get("address")
+            if isinstance(address, (list, tuple)):
+                address = "\n".join(str(line) for line in address)
+            meta_rows.append({
+                "source_id": source_id,
+                "place_id": place["place_id"],
+                "place_name": place.get("place_name"),
+                "city_name": place.get("city_name"),
+                "num_all": DataSource.int_or_none(place.get("num_all")),
+                "address": address,
+                "place_url": place.get("place_url"),
+                "latitude": DataSource.float_or_none(coordinates[0]),
+                "longitude": DataSource.float_or_none(coordinates[1]),
+            })
+    pq.write_table(
+        pa.Table.from_pylist(meta_rows, schema=pa.schema([
+            ("source_id", pa.string()),
+            ("place_id", pa.string()),
+            ("place_name", pa.string()),
+            ("city_name", pa.string()),
+            ("num_all", pa.int32()),
+            ("address", pa.string()),
+            ("place_url", pa.string()),
+            ("latitude", pa.float64()),
+            ("longitude", pa.float64()),
+        ])),
+        os.path.join(parquet_path, "meta.parquet"),
+    )
+
+    schema = pa.schema([
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("place_id", pa.string()),
+        ("num_free", pa.int32()),
+    ])
+
+    storage = Storage()
+    for attributes in tqdm.tqdm(sources.sources):
+        source_id = attributes["source_id"]
+        data_source = DataSources.create(source_id)
+
+        for month in storage.find_months(source_id, min_timestamp=min_date, max_timestamp=max_date):
+            month_start, month_end = storage.month_range(month)
+            timestamps, place_ids, num_frees = [], [], []
+            for timestamp, canonical_data in storage.iter_source_canonical(
+                    data_source,
+                    min_timestamp=max(month_start, min_date) if min_date else month_start,
+                    max_timestamp=min(month_end, max_date) if max_date else month_end,
+            ):
+                utc_timestamp = to_utc(timestamp)
+                for data in canonical_data:
+                    if place_id_filters and not place_id_filters.matches(data["place_id"]):
+                        continue
+                    timestamps.append(utc_timestamp)
+                    place_ids.append(data["place_id"])
+                    num_frees.append(data["num_free"])
+
+            if not timestamps:
+                continue
+
+            filename = os.path.join(
+                parquet_path, "snapshots", f"source_id={source_id}", f"month={month}", "data.parquet"
+            )
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            pq.write_table(
+                pa.Table.from_arrays([
+                    pa.array(timestamps, type=schema.field("timestamp").type),
+                    pa.array(place_ids, type=pa.string()),
+                    pa.array(num_frees, type=pa.int32()),
+                ], schema=schema),
+                filename + ".tmp",
+            )
+            os.replace(filename + ".tmp", filename)
+
+
+def dump_sources_export(source_timestamps, source_id_to_meta, place_id_filters):
+    """
+    Print the meta data and timestamps of each place as json list, one source at a time
+    :param source_timestamps: iterable of tuple (source_id, place_id_to_timestamps),
+        e.g. from `Storage.iter_sources_timestamps`
+    """
+    num_places = 0
+    print("[", end="")
+    for source_id, place_id_to_timestamps in source_timestamps:
+        for place_export in convert_place_id_to_timestamps_to_export(
+                place_id_to_timestamps, source_id_to_meta, place_id_filters
+        ):
+            place_json = "\n".join(
+                f"  {line}"
+                for line in to_json(place_export, indent=2).splitlines()
+            )
+            print(f"{',' if num_places else ''}\n{place_json}", end="")
+            num_places += 1
+
+    print("\n]" if num_places else "]")
 
 
 def convert_place_id_to_timestamps_to_export(place_id_to_timestamps, source_id_to_meta, place_id_filters):
@@ -352,47 +813,77 @@ def convert_place_id_to_timestamps_to_export(place_id_to_timestamps, source_id_t
     return ret_places
 
 
-def dump_stats(place_arrays, place_id_filters=None, format="text"):
+def dump_resampled(place_id_to_buckets, place_id_filters=None, format="csv"):
+    """
+    Print the result of `Storage.load_resampled`, empty buckets are skipped
+    """
+    rows = []
+    for place_id in sorted(place_id_to_buckets):
+        if place_id_filters and not place_id_filters.matches(place_id):
+            continue
+        buckets = place_id_to_buckets[place_id]
+        for i in np.flatnonzero(buckets["count"]):
+            row = {
+                "place_id": place_id,
+                "timestamp": buckets["timestamps"][i].astype(datetime.datetime).isoformat(),
+                "count": int(buckets["count"][i]),
+            }
+            for key in ("last", "mean", "min", "max"):
+                row[key] = round(float(buckets[key][i]), 2)
+            rows.append(row)
+
+    if format == "json":
+        print(to_json(rows))
+
+    elif format == "csv":
+        writer = csv.DictWriter(sys.stdout, ["place_id", "timestamp", "count", "last", "mean", "min", "max"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def dump_daily_rollups(place_id_to_rollup, place_id_filters=None, format="text"):
+    rows = []
+    for place_id in sorted(place_id_to_rollup):
+        if place_id_filters and not place_id_filters.matches(place_id):
+            continue
+        for day in place_id_to_rollup[place_id]["days"]:
+            rows.append({"place_id": place_id, **day})
+
+    if format == "text":
+        for row in rows:
+            print(
+                f"{row['place_id']} {row['date']} {row['count']:5} snapshots"
+                f" {row['min']:5} min {row['max']:5} max {row['mean']:8} mean"
+            )
+
+    elif format == "json":
+        print(to_json({
+            place_id: rollup
+            for place_id, rollup in place_id_to_rollup.items()
+            if not place_id_filters or place_id_filters.matches(place_id)
+        }))
+
+    elif format == "csv":
+        writer = csv.DictWriter(sys.stdout, ["place_id", "date", "count", "min", "max", "mean"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def dump_stats(place_arrays, place_id_filters=None, format="text", place_id_to_num_all=None):
+    """
+    :param place_arrays: list of PlaceSeries
+    :param place_id_to_num_all: optional dict of place capacities for the occupancy stats
+    """
     max_place_id_length = max(len(place["place_id"]) for place in place_arrays)
 
     stats_list = []
     for place in place_arrays:
-        if place_id_filters and not place_id_filters.matches(place["place_id"]):
+        if place_id_filters and not place_id_filters.matches(place.place_id):
             continue
 
-        num_changes = 0
-        last_value = "---"
-        for value in place["y"]:
-            if value != last_value:
-                last_value = value
-                num_changes += 1
-
-        true_y = [v for v in place["y"] if v is not None]
-
-        abs_change = 0
-        if true_y:
-            last_v = true_y[0]
-            for v in true_y[1:]:
-                abs_change += abs(v - last_v)
-                last_v = v
-            abs_change / len(true_y)
-
-        stats = {
-            "place_id": place["place_id"],
-            "num_timestamps": len(place["x"]),
-            "num_changes": num_changes,
-            "abs_changes": abs_change,
-            "min_timestamp": place["x"][0],
-            "max_timestamp": place["x"][-1],
-        }
-
-        for key in ("average", "min", "max", "median", "mean", "std", "var"):
-            if true_y:
-                stats[key] = round(getattr(np, key)(true_y), 1)
-            else:
-                stats[key] = ""
-
-        stats_list.append(stats)
+        stats_list.append(place_series_stats(
+            place, num_all=(place_id_to_num_all or dict()).get(place.place_id)
+        ))
 
     if format == "text":
         for place in stats_list:
@@ -422,41 +913,99 @@ def dump_stats(place_arrays, place_id_filters=None, format="text"):
             print(fp.read())
 
 
-def export_csv(sources, min_date, max_date, place_id_filters, csv_path):
+def load_place_id_to_num_all(sources):
+    """
+    Return the capacities of all places from the stored meta data.
+    Sources without usable meta data are skipped.
+    """
+    storage = Storage()
+    place_id_to_num_all = dict()
+    for attributes in sources.sources:
+        try:
+            meta_data = storage.load_meta(attributes["source_id"])
+            if not meta_data:
+                continue
+            canonical_data = DataSources.create(attributes["source_id"]).transform_meta_data(meta_data)
+        except Exception as e:
+            print(f"no meta data for {attributes['source_id']}: {e.__class__.__name__}: {e}", file=sys.stderr)
+            continue
+
+        for place in canonical_data["places"].values():
+            place_id_to_num_all[place["place_id"]] = place.get("num_all")
+
+    return place_id_to_num_all
+
+
+def export_csv(sources, min_date, max_date, place_id_filters, csv_path, processes=None):
     if min_date:
         min_date = from_utc(min_date)
         max_date = from_utc(max_date)
 
-        place_id_to_timestamps = Storage().load_sources(sources, min_timestamp=min_date, max_timestamp=max_date)
-        export_place_id_to_timestamps_csv(place_id_to_timestamps, min_date, csv_path, place_id_filters=place_id_filters)
+        snapshots = Storage().iter_canonical(sources, min_timestamp=min_date, max_timestamp=max_date)
+        export_snapshots_csv(snapshots, min_date, csv_path, place_id_filters=place_id_filters)
 
     else:
-        existing_dates = set()
-        for root, dirs, files in os.walk(csv_path):
-            for fn in files:
-                if fn.endswith(".csv"):
-                    try:
-                        existing_dates.add(
-                            datetime.datetime.strptime(fn[:10], "%Y-%m-%d").date()
-                        )
-                    except ValueError:
-                        pass
-
-        yesterday = to_utc(datetime.datetime.now() - datetime.timedelta(days=1)).date()
-        current_date = datetime.date(2020, 3, 24)  # my earliest records
-        print(f"exporting {current_date} - {yesterday}")
-        print(f"already existing: {existing_dates}")
-
-        while current_date <= yesterday:
-            if current_date not in existing_dates:
-                min_date = datetime.datetime(current_date.year, current_date.month, current_date.day)
-                max_date = min_date + datetime.timedelta(days=1) - datetime.timedelta(seconds=1)
-
-                place_id_to_timestamps = Storage().load_sources(sources, min_timestamp=min_date, max_timestamp=max_date)
-                export_place_id_to_timestamps_csv(
-                    place_id_to_timestamps, min_date, csv_path, place_id_filters=place_id_filters
-                )
-            current_date += datetime.timedelta(days=1)
+        export_csv_missing_days(sources, place_id_filters, csv_path, processes=processes)
+
+
+def export_csv_missing_days(sources, place_id_filters, csv_path, processes=None):
+    existing_dates = set()
+    for root, dirs, files in os.walk(csv_path):
+        for fn in files:
+            if fn.endswith(".csv"):
+                try:
+                    existing_dates.add(
+                        datetime.datetime.strptime(fn[:10], "%Y-%m-%d").date()
+                    )
+                except ValueError:
+                    pass
+
+    yesterday = to_utc(datetime.datetime.now() - datetime.timedelta(days=1)).date()
+    current_date = datetime.date(2020, 3, 24)  # my earliest records
+    print(f"exporting {current_date} - {yesterday}")
+    print(f"already existing: {existing_dates}")
+
+    missing_dates = []
+    while current_date <= yesterday:
+        if current_date not in existing_dates:
+            missing_dates.append(current_date)
+        current_date += datetime.timedelta(days=1)
+
+    if not missing_dates:
+        return
+
+    # walk the snapshot tree only once for all missing days
+    storage = Storage()
+    date_to_files = storage.find_sources_files_by_day(
+        sources,
+        day_func=lambda ts: to_utc(ts).date(),
+        min_timestamp=from_utc(datetime.datetime.combine(missing_dates[0], datetime.time())),
+        max_timestamp=from_utc(datetime.datetime.combine(missing_dates[-1], datetime.time(23, 59, 59))),
+    )
+
+    tasks = [
+        (date, date_to_files.get(date, dict()))
+        for date in missing_dates
+    ]
+    export_func = partial(_export_csv_day, storage, csv_path, place_id_filters)
+
+    if processes and processes > 1:
+        with Pool(processes) as pool:
+            for _ in pool.imap_unordered(export_func, tasks):
+                pass
+    else:
+        for task in tasks:
+            export_func(task)
+
+
+def _export_csv_day(storage, csv_path, place_id_filters, task):
+    date, source_id_to_files = task
+    export_snapshots_csv(
+        storage.iter_files_canonical(source_id_to_files),
+        datetime.datetime(date.year, date.month, date.day),
+        csv_path,
+        place_id_filters=place_id_filters,
+    )
 
 
 def main():
@@ -503,46 +1052,119 @@ def main():
             print(source)
 
     elif args.command == "dump" or args.command == "test":
-        all_data = download_sources(sources, use_cache=args.cache)
+        all_data = download_sources(sources, use_cache=args.cache, concurrency=args.concurrency)
         if args.command == "dump":
             dump_raw_data(all_data, place_id_filters=place_id_filters)
 
     elif args.command == "dump-meta" or args.command == "test-meta":
-        all_data = download_sources(sources, use_cache=args.cache, meta=True)
+        all_data = download_sources(sources, use_cache=args.cache, meta=True, concurrency=args.concurrency)
         if args.command == "dump-meta":
             dump_raw_data(all_data, place_id_filters=place_id_filters)
 
     elif args.command == "store":
-        download_sources(sources, use_cache=args.cache, do_store=True)
+        download_sources(sources, use_cache=args.cache, do_store=True, concurrency=args.concurrency)
 
     elif args.command == "store-meta":
-        download_sources(sources, use_cache=args.cache, do_store=True, meta=True)
+        download_sources(sources, use_cache=args.cache, do_store=True, meta=True, concurrency=args.concurrency)
 
     elif args.command == "load":
-        place_id_to_timestamps = Storage().load_sources(sources, min_timestamp=min_date, max_timestamp=max_date)
-        dump_place_id_to_timestamps(place_id_to_timestamps, place_id_filters=place_id_filters, format=args.format)
+        source_timestamps = Storage().iter_sources_timestamps(
+            sources, min_timestamp=min_date, max_timestamp=max_date, processes=args.processes
+        )
+        dump_sources_timestamps(source_timestamps, place_id_filters=place_id_filters, format=args.format)
 
     elif args.command == "load-meta":
         source_id_to_meta = Storage().load_sources_meta(sources, min_timestamp=min_date, max_timestamp=max_date)
         dump_source_to_meta(source_id_to_meta, format=args.format)
 
     elif args.command == "load-stats":
-        place_arrays = Storage().load_sources_arrays(sources, min_timestamp=min_date, max_timestamp=max_date)
-        dump_stats(place_arrays, place_id_filters=place_id_filters, format=args.format)
+        place_arrays = Storage().load_sources_arrays(
+            sources, min_timestamp=min_date, max_timestamp=max_date, processes=args.processes
+        )
+        dump_stats(
+            place_arrays, place_id_filters=place_id_filters, format=args.format,
+            place_id_to_num_all=load_place_id_to_num_all(sources) if args.format != "text" else None,
+        )
 
     elif args.command == "export-csv":
-        export_csv(sources, min_date, max_date, place_id_filters, args.csv_path)
+        export_csv(sources, min_date, max_date, place_id_filters, args.csv_path, processes=args.processes)
 
     elif args.command == "export":
-        place_id_to_timestamps = Storage().load_sources(sources, min_timestamp=min_date, max_timestamp=max_date)
         source_id_to_meta = Storage().load_sources_meta(sources)
-        data = convert_place_id_to_timestamps_to_export(place_id_to_timestamps, source_id_to_meta, place_id_filters=place_id_filters)
-        print(to_json(data, indent=2))
+        source_timestamps = Storage().iter_sources_timestamps(
+            sources, min_timestamp=min_date, max_timestamp=max_date, processes=args.processes
+        )
+        dump_sources_export(source_timestamps, source_id_to_meta, place_id_filters=place_id_filters)
+
+    elif args.command == "export-parquet":
+        source_id_to_meta = Storage().load_sources_meta(sources)
+        export_parquet(
+            sources, source_id_to_meta, args.parquet_path,
+            min_date=min_date, max_date=max_date, place_id_filters=place_id_filters,
+        )
 
     elif args.command == "to-influxdb":
-        place_id_to_timestamps = Storage().load_sources(sources, min_timestamp=min_date)
         source_id_to_meta = Storage().load_sources_meta(sources)
-        export_place_id_to_timestamps_influx(place_id_to_timestamps, source_id_to_meta, place_id_filters=place_id_filters)
+        writer = InfluxWriter()
+        writer.create_database()
+        source_id_to_min_timestamp = influx_min_timestamps(writer, source_id_to_meta, place_id_filters=place_id_filters)
+        complete_source_ids = set()
+        for source_id, min_timestamp in source_id_to_min_timestamp.items():
+            if min_date and (not min_timestamp or min_date > min_timestamp):
+                source_id_to_min_timestamp[source_id] = min_timestamp = min_date
+            # the source watermark may only advance if nothing since the last one is skipped
+            source_watermark = writer.source_watermarks.get(source_id)
+            if not min_timestamp or (source_watermark and min_timestamp.isoformat() <= source_watermark):
+                complete_source_ids.add(source_id)
+        snapshots = Storage().iter_canonical(
+            sources, min_timestamp=min_date, source_id_to_min_timestamp=source_id_to_min_timestamp,
+        )
+        export_snapshots_influx(
+            snapshots, source_id_to_meta, writer,
+            place_id_filters=place_id_filters, complete_source_ids=complete_source_ids,
+        )
+
+    elif args.command == "daemon":
+        run_daemon(
+            sources, use_cache=args.cache, interval=parse_interval(args.interval, divides_day=False) if args.interval else None,
+            concurrency=args.concurrency,
+            adaptive=args.schedule == "adaptive",
+        )
+
+    elif args.command == "resample":
+        interval = parse_interval(args.interval or "1h")
+        storage = Storage()
+        storage.resample_sources(sources, interval, min_timestamp=min_date, max_timestamp=max_date)
+        if args.format != "text":
+            dump_resampled(
+                storage.load_resampled(sources, interval, min_timestamp=min_date, max_timestamp=max_date),
+                place_id_filters=place_id_filters, format=args.format,
+            )
+
+    elif args.command == "rollup":
+        Storage().rebuild_daily_rollups(sources)
+
+    elif args.command == "load-rollups":
+        place_id_to_rollup = Storage().load_sources_daily_rollups(
+            sources, min_timestamp=min_date, max_timestamp=max_date
+        )
+        dump_daily_rollups(place_id_to_rollup, place_id_filters=place_id_filters, format=args.format)
+
+    elif args.command == "compact":
+        Storage().compact_sources(sources)
+
+    elif args.command == "bench":
+        bench_sources(sources, format=args.format)
+
+    elif args.command == "bench-parse":
+        bench_parse(sources)
+
+    elif args.command == "check-place-ids":
+        if check_place_ids(sources, min_date=min_date, max_date=max_date):
+            sys.exit(1)
+
+    elif args.command == "compress":
+        Storage(compression=args.compression or settings.SNAPSHOT_COMPRESSION or "gzip").compress_sources(sources)
 
     else:
         print(f"Unknown command '{args.command}'")
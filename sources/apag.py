@@ -1,7 +1,7 @@
 import bs4
 import json
 
-from util import DataSource
+from util import DataSource, settings
 
 
 class ParkingApag(DataSource):
@@ -10,6 +10,9 @@ class ParkingApag(DataSource):
     web_url = "https://www.apag.de/"
 
     def download_snapshot_data(self):
+        if settings.FAST_HTML_PARSING:
+            return self._download_snapshot_data_tree()
+
         soup = self.get_html_soup(self.web_url)
 
         parking_places = []
@@ -27,11 +30,33 @@ class ParkingApag(DataSource):
 
         return parking_places
 
-    def download_meta_data(self):
-        soup = self.get_html_soup(self.web_url)
+    def _download_snapshot_data_tree(self):
+        """
+        Same as `download_snapshot_data` but with the faster lxml tree
+        """
+        tree = self.get_html_tree(self.web_url)
 
         parking_places = []
 
+        for div in tree.xpath(self.xpath_class("div", "houses")):
+            city_name = div.getprevious()
+            assert city_name is not None and city_name.tag == "h2", "markup changed"
+            city_name = city_name.text_content().split()[-1]
+
+            for li in div.iter("li"):
+                parking_places.append({
+                    "place_name": "%s %s" % (city_name, li.find(".//span").find(".//a").text_content().strip()),
+                    "num_free": self.int_or_none(
+                        li.xpath(self.xpath_class("span", "counter"))[0].text_content().split()[0]
+                    ),
+                })
+
+        return parking_places
+
+    def download_meta_data(self):
+        soup = self.get_html_soup(self.web_url)
+
+        places = []
         for div in soup.find_all("div", {"class": "houses"}):
             city_name = div.previous_sibling.previous_sibling
             assert city_name.name == "h2", "markup changed"
@@ -40,28 +65,37 @@ class ParkingApag(DataSource):
             for li in div.find_all("li"):
                 place_link = li.find("span").find("a")
                 place_url = self.web_url.rstrip("/") + place_link.get("href")
-                soup = self.get_html_soup(place_url)
-
-                elem_total = soup.find("span", {"class": "total"})
-                elem_address = soup.find("div", {"class": "address"})
+                places.append((city_name, place_link, place_url))
 
-                elem_lat = soup.find("meta", {"itemprop": "latitude"})
-                elem_long = soup.find("meta", {"itemprop": "longitude"})
-                coords = None
-                if elem_lat and elem_long:
-                    coords = [self.float_or_none(elem_lat.get("content")), self.float_or_none(elem_long.get("content"))]
+        parking_places = []
 
-                parking_places.append({
-                    "city_name": city_name,
-                    "place_name": place_link.text.strip(),
-                    "place_url": place_url,
-                    "num_all": self.int_or_none(elem_total.text.split()[-1]) if elem_total else None,
-                    "address": [i for i in elem_address.text.strip().split("\n") if i],
-                    "coordinates": coords,
-                })
+        place_details = self.get_html_details((place[2] for place in places), self._parse_place_page)
+        for (city_name, place_link, place_url), details in zip(places, place_details):
+            parking_places.append({
+                "city_name": city_name,
+                "place_name": place_link.text.strip(),
+                "place_url": place_url,
+                **details,
+            })
 
         return parking_places
 
+    def _parse_place_page(self, soup):
+        elem_total = soup.find("span", {"class": "total"})
+        elem_address = soup.find("div", {"class": "address"})
+
+        elem_lat = soup.find("meta", {"itemprop": "latitude"})
+        elem_long = soup.find("meta", {"itemprop": "longitude"})
+        coords = None
+        if elem_lat and elem_long:
+            coords = [self.float_or_none(elem_lat.get("content")), self.float_or_none(elem_long.get("content"))]
+
+        return {
+            "num_all": self.int_or_none(elem_total.text.split()[-1]) if elem_total else None,
+            "address": [i for i in elem_address.text.strip().split("\n") if i],
+            "coordinates": coords,
+        }
+
     def transform_meta_data(self, data):
         ret_data = super().transform_meta_data(data)
         old_places = ret_data["places"]
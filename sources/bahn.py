@@ -16,6 +16,7 @@ if BAHN_API_TOKEN:
 
         source_id = "bahn-api-parken"
         web_url = "https://api.deutschebahn.com/bahnpark/v1/spaces/occupancies"
+        conditional_requests = True
 
         def download_meta_data(self):
             self.session.headers.update({
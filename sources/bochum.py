@@ -4,6 +4,9 @@ import json
 from util import DataSource
 
 
+NUM_ALL_RE = re.compile(r"Stellplätze:? (\d+).*")
+
+
 class ParkingBochum(DataSource):
 
     source_id = "parken-in-bochum"
@@ -34,9 +37,7 @@ class ParkingBochum(DataSource):
     def download_meta_data(self):
         soup = self.get_html_soup(self.web_url + "parkhaeuser/")
 
-        parking_places = []
-
-        num_all_re = re.compile(r"Stellplätze:? (\d+).*")
+        places = []
 
         for div in soup.find_all("div", {"class": "details"}):
             place_name = div.find("h3").text.strip()
@@ -49,23 +50,29 @@ class ParkingBochum(DataSource):
             if "Bochum" not in address[-1]:
                 address = None
 
-            num_all = None
-
             place_url = actions[0].get("href")
             place_url = self.web_url.rstrip("/") + place_url
-            soup = self.get_html_soup(place_url)
+            places.append((place_name, place_url, address))
 
-            div = soup.find(text="Stellplätze:")
-            if not div:
-                div = soup.find(text="Stellplätze")
-            match = num_all_re.match(div.parent.parent.text.strip())
-            num_all = self.int_or_none(match.groups()[0]) if match else None
+        parking_places = []
 
+        place_details = self.get_html_details((place[1] for place in places), self._parse_place_page)
+        for (place_name, place_url, address), details in zip(places, place_details):
             parking_places.append({
                 "place_name": place_name,
                 "place_url": place_url,
                 "address": address,
-                "num_all": num_all,
+                "num_all": details["num_all"],
             })
 
         return parking_places
+
+    def _parse_place_page(self, soup):
+        div = soup.find(text="Stellplätze:")
+        if not div:
+            div = soup.find(text="Stellplätze")
+        match = NUM_ALL_RE.match(div.parent.parent.text.strip())
+
+        return {
+            "num_all": self.int_or_none(match.groups()[0]) if match else None,
+        }
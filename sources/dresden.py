@@ -1,9 +1,14 @@
 import re
 import json
 
+import bs4
+
 from util import DataSource
 
 
+TABLE_STRAINER = bs4.SoupStrainer("div", {"class": "element_table"})
+
+
 class ParkingDresden(DataSource):
 
     source_id = "dresden-parken"
@@ -11,7 +16,7 @@ class ParkingDresden(DataSource):
     city_name = "Dresden"
 
     def download_snapshot_data(self):
-        soup = self.get_html_soup(self.web_url)
+        soup = self.get_html_soup(self.web_url, parse_only=TABLE_STRAINER)
 
         parking_places = []
 
@@ -41,9 +46,9 @@ class ParkingDresden(DataSource):
         return parking_places
 
     def download_meta_data(self):
-        soup = self.get_html_soup(self.web_url)
+        soup = self.get_html_soup(self.web_url, parse_only=TABLE_STRAINER)
 
-        parking_places = []
+        rows = []
 
         remove_jsession_re = re.compile(r";jsessionid=[0-9A-Z]+")
 
@@ -62,31 +67,40 @@ class ParkingDresden(DataSource):
                     for td in tr.find_all("td")
                 ][1:]
                 row_text = [td.text.strip() for td in row]
-                parking_place_name = row_text[0]
 
                 place_url = "https://www.dresden.de/apps_ext/ParkplatzApp" + row[0].find("a").get("href").lstrip(".")
                 place_url = remove_jsession_re.sub("", place_url)
-                soup = self.get_html_soup(place_url)
+                rows.append((parking_group_name, row_text, place_url))
 
-                address = soup.find("h3", text="Adresse")
-                if address:
-                    address = address.next_sibling.next_sibling
-                    br = address.find("br")
-                    address = [s.strip() for s in br.previous_sibling.split(",")]
+        parking_places = []
 
-                coordinates = None
-                gps_lon = soup.find("div", text="GPS-Lon:")
-                gps_lat = soup.find("div", text="GPS-Lat:")
-                if gps_lon and gps_lat:
-                    coordinates = [gps_lat.next_sibling.text, gps_lon.next_sibling.text]
-
-                parking_places.append({
-                    "group_name": parking_group_name,
-                    "place_name": parking_place_name,
-                    "place_url": place_url,
-                    "num_all": self.int_or_none(row_text[1]),
-                    "address": address,
-                    "coordinates": coordinates,
-                })
+        place_details = self.get_html_details((row[2] for row in rows), self._parse_place_page)
+        for (parking_group_name, row_text, place_url), details in zip(rows, place_details):
+            parking_places.append({
+                "group_name": parking_group_name,
+                "place_name": row_text[0],
+                "place_url": place_url,
+                "num_all": self.int_or_none(row_text[1]),
+                "address": details["address"],
+                "coordinates": details["coordinates"],
+            })
 
         return parking_places
+
+    def _parse_place_page(self, soup):
+        address = soup.find("h3", text="Adresse")
+        if address:
+            address = address.next_sibling.next_sibling
+            br = address.find("br")
+            address = [s.strip() for s in br.previous_sibling.split(",")]
+
+        coordinates = None
+        gps_lon = soup.find("div", text="GPS-Lon:")
+        gps_lat = soup.find("div", text="GPS-Lat:")
+        if gps_lon and gps_lat:
+            coordinates = [gps_lat.next_sibling.text, gps_lon.next_sibling.text]
+
+        return {
+            "address": address,
+            "coordinates": coordinates,
+        }
@@ -13,6 +13,7 @@ class ParkingDuesseldorf(DataSource):
     source_id = "vtmanager-duesseldorf-parken"
     web_url = "https://vtmanager.duesseldorf.de/info/?parkquartier#main"
     city_name = "Düsseldorf"
+    conditional_requests = True
 
     def download_meta_data(self):
         markup = self.get_url(
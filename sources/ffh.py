@@ -12,6 +12,8 @@ CITIES = [
     "Bad-Homburg",
 ]
 
+TABLE_STRAINER = bs4.SoupStrainer("table", {"id": "trafficParkingList"})
+
 URLS = [
     f"https://www.ffh.de/verkehr/parkhaeuser/parkhaus-info-{city}.html"
     for city in CITIES
@@ -27,7 +29,9 @@ class ParkingFFH(DataSource):
         parking_places = []
 
         for city, url in zip(CITIES, URLS):
-            soup = self.get_html_soup(f"{self.web_url}parkhaus-info-{city.lower()}.html")
+            soup = self.get_html_soup(
+                f"{self.web_url}parkhaus-info-{city.lower()}.html", parse_only=TABLE_STRAINER
+            )
 
             table = soup.find("table", {"id": "trafficParkingList"})
             for tr in table.find_all("tr"):
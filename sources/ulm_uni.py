@@ -32,6 +32,7 @@ class ParkingUlmUni(DataSource):
     def _parse_page(self, place_dict, url_part):
         soap = self.get_html_soup(f"http://tsu-app.rrooaarr.biz/front/{url_part}.html")
 
+        counters = []
         for h2 in soap.find("section").find_all("h2"):
             ul = h2.find_next_sibling("ul")
             assert ul, f"Expected ul in siblings of {h2}"
@@ -51,24 +52,30 @@ class ParkingUlmUni(DataSource):
 
                 if "cid" in div.attrs:
                     cid = div.attrs["cid"]
-                    num_all = self.int_or_none(div.attrs["max"])
-                    num_occupied = self._get_num_occupied(div.attrs["cid"])
-                    num_free = None
-                    if num_all is not None and num_occupied is not None:
-                        num_free = num_all - num_occupied
-
-                    if cid not in place_dict:
-                        place_dict[cid] = {
-                            "v": 2,
-                            "place_id": cid,
-                            "place_name": f"{place_name} ({place_number})",
-                            "num_free": num_free,
-                            "num_all": num_all,
-                        }
-
-    def _get_num_occupied(self, cid):
-        text = self.get_url(f"http://tsu-app.rrooaarr.biz/front/soap.php?counterid={cid}")
-        return self.int_or_none(text)
+                    if cid not in place_dict and cid not in (counter[0] for counter in counters):
+                        counters.append((cid, f"{place_name} ({place_number})", self.int_or_none(div.attrs["max"])))
+
+        nums_occupied = self._get_nums_occupied([counter[0] for counter in counters])
+
+        for (cid, place_name, num_all), num_occupied in zip(counters, nums_occupied):
+            num_free = None
+            if num_all is not None and num_occupied is not None:
+                num_free = num_all - num_occupied
+
+            place_dict[cid] = {
+                "v": 2,
+                "place_id": cid,
+                "place_name": place_name,
+                "num_free": num_free,
+                "num_all": num_all,
+            }
+
+    def _get_nums_occupied(self, cids):
+        texts = self.get_urls(
+            f"http://tsu-app.rrooaarr.biz/front/soap.php?counterid={cid}"
+            for cid in cids
+        )
+        return [self.int_or_none(text) for text in texts]
 
     def transform_snapshot_data(self, data):
         ret_data = []
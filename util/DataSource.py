@@ -1,15 +1,33 @@
 import requests
 import re
 import os
+import json
 import hashlib
+import datetime
 import unicodedata
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree.ElementTree import fromstring
 
 import xmljson
 
 import bs4
+import lxml.html
 
-from util import RegexFilter
+from util import RegexFilter, settings
+from util._http import get_http_adapter
+from util.ResponseCache import ResponseCache
+
+
+class ResponseUnchanged(Exception):
+    """
+    Raised by `DataSource.get_url` in conditional mode
+    when the response did not change since the last stored snapshot
+    """
+    def __init__(self, url, since=None):
+        super().__init__(f"{url} unchanged since {since}")
+        self.url = url
+        self.since = since
 
 
 class DataSources:
@@ -75,8 +93,38 @@ class DataSource:
     For canonical data export you can override `transform_snapshot_data()` to
     convert your snapshot data into a generic format
 
+        Set `conditional_requests = True` if the snapshot is determined by a single
+        request (like a json or WFS endpoint). Stored snapshots will then skip downloading
+        and parsing if the server reports (via ETag/Last-Modified) or the content hash shows
+        that nothing changed since the last stored snapshot.
+
+        The `daemon` command scrapes each source every `poll_interval` seconds
+        (or `settings.DAEMON_INTERVAL` if None). In adaptive scheduling mode the interval
+        varies between `min_poll_interval` and `max_poll_interval` depending on how
+        often the data changed.
+
+        Detail pages of places in `download_meta_data()` should be read via
+        `get_html_details()` which reuses the parsed results for
+        `meta_detail_max_age` seconds (or `settings.META_DETAIL_MAX_AGE`).
+
+        With `--cache`, responses are reused for `cache_ttl` seconds
+        (or `settings.RESPONSE_CACHE_TTL`, None means forever).
+
+        The canonical data of each snapshot file is cached on disk.
+        Increase the class-attribute `transform_version` whenever
+        `transform_snapshot_data()` changes its output to invalidate the cache
+        and the compacted months.
+
     """
 
+    transform_version = 1
+    conditional_requests = False
+    poll_interval = None
+    min_poll_interval = 60
+    max_poll_interval = 60 * 60
+    cache_ttl = None
+    meta_detail_max_age = None
+
     _re_double_minus = re.compile(r"--+")
 
     def __init_subclass__(cls, **kwargs):
@@ -97,14 +145,38 @@ class DataSource:
         attributes["class"] = cls
         DataSources._registered_sources[source_id] = attributes
 
-    def __init__(self, use_cache=False):
+    def __init__(self, use_cache=False, conditional=False, offline=False):
+        """
+        :param use_cache: bool, store and reuse responses in the cache directory
+        :param conditional: bool, enable conditional requests if the class supports them
+        :param offline: bool, only replay responses from the cache directory,
+            requests that are not cached raise FileNotFoundError
+        """
         self.session = requests.Session()
+        # share keep-alive connections with all other sources in this process
+        self.session.mount("http://", get_http_adapter())
+        self.session.mount("https://", get_http_adapter())
         self.cache_dir = os.path.join(
             os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
             "cache",
             self.source_id,
         )
-        self.use_cache = use_cache
+        self.meta_cache_filename = os.path.join(
+            os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+            "meta-cache",
+            f"{self.source_id}.json",
+        )
+        self.http_state_filename = os.path.join(
+            os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+            "http-state",
+            f"{self.source_id}.json",
+        )
+        self.response_cache = ResponseCache.get_instance()
+        self.use_cache = use_cache or offline
+        self.offline = offline
+        self.conditional = conditional and self.conditional_requests
+        self._http_state = None
+        self._pending_http_state = dict()
 
         self.session.headers = {
             "User-Agent": "Mozilla/5.0 Gecko/20100101 Firefox/74.0"
@@ -117,15 +189,35 @@ class DataSource:
         pass
 
     def get_url(self, url, method="GET", data=None, encoding=None):
+        cache_key = self.response_cache.get_key(url, method=method, data=data)
         if self.use_cache:
-            if os.path.exists(self.get_cache_filename(url)):
-                with open(self.get_cache_filename(url)) as fp:
-                    return fp.read()
+            text = self.response_cache.get(
+                self.source_id, cache_key,
+                ttl=None if self.offline else self.get_cache_ttl(),
+            )
+            if text is not None:
+                return text
+
+        if self.offline:
+            raise FileNotFoundError(f"No cached response for {url}")
+
+        headers = None
+        state_key = None
+        if self.conditional:
+            state_key = hashlib.md5(f"{method} {url} {data}".encode("utf-8")).hexdigest()
+            state = self.http_state.get(state_key) or dict()
+            headers = dict()
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
 
         for try_num in range(3):
             try:
                 print("downloading", url)
-                response = self.session.request(method, url, data=data, timeout=10)
+                response = self.session.request(method, url, data=data, headers=headers, timeout=10)
+                if state_key and response.status_code == 304:
+                    self._raise_unchanged(url, state_key)
                 if encoding is None:
                     text = response.text
                 else:
@@ -135,29 +227,196 @@ class DataSource:
                 if try_num == 2:
                     raise
 
+        if state_key:
+            content_hash = hashlib.sha1(response.content).hexdigest()
+            if content_hash == state.get("hash"):
+                self._raise_unchanged(url, state_key)
+            self._pending_http_state[state_key] = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "hash": content_hash,
+            }
+
         if self.use_cache:
-            if not os.path.exists(self.cache_dir):
-                os.makedirs(self.cache_dir)
-            with open(self.get_cache_filename(url), "w") as fp:
-                fp.write(text)
+            self.response_cache.put(self.source_id, cache_key, text)
 
         return text
 
-    def get_html_soup(self, url, encoding=None):
-        text = self.get_url(url, encoding=encoding)
-        soup = bs4.BeautifulSoup(text, parser="html.parser", features="lxml")
+    @property
+    def http_state(self):
+        """
+        ETag, Last-Modified and content hash of previous conditional requests
+        :return: dict, request key -> dict
+        """
+        if self._http_state is None:
+            try:
+                with open(self.http_state_filename) as fp:
+                    self._http_state = json.load(fp)
+            except (OSError, ValueError):
+                self._http_state = dict()
+        return self._http_state
+
+    def _raise_unchanged(self, url, state_key):
+        state = self.http_state[state_key]
+        state["checked"] = datetime.datetime.now().isoformat()
+        raise ResponseUnchanged(url, since=state.get("changed"))
+
+    def commit_http_state(self):
+        """
+        Remember the responses of conditional requests.
+        Call this after the snapshot data has been stored.
+        """
+        now = datetime.datetime.now().isoformat()
+        for key, state in self._pending_http_state.items():
+            self.http_state[key] = {
+                **state,
+                "changed": now,
+                "checked": now,
+            }
+        self._pending_http_state = dict()
+        self.save_http_state()
+
+    def save_http_state(self):
+        if self._http_state is None:
+            return
+        os.makedirs(os.path.dirname(self.http_state_filename), exist_ok=True)
+        with open(self.http_state_filename, "w") as fp:
+            json.dump(self._http_state, fp, indent=1)
+
+    def get_urls(self, urls, method="GET", data=None, encoding=None, concurrency=None):
+        """
+        Download several urls at the same time via `get_url`.
+
+        :param urls: list of str
+        :param concurrency: int, max number of simultaneous requests,
+            defaults to `settings.SUBREQUEST_CONCURRENCY`
+        :return: list of str, in the order of `urls`,
+            the first error (in order of `urls`) is raised
+        """
+        urls = list(urls)
+        concurrency = min(concurrency or settings.SUBREQUEST_CONCURRENCY, len(urls))
+        if concurrency <= 1:
+            return [
+                self.get_url(url, method=method, data=data, encoding=encoding)
+                for url in urls
+            ]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(
+                lambda url: self.get_url(url, method=method, data=data, encoding=encoding),
+                urls
+            ))
+
+    def get_html_soup(self, url, encoding=None, parse_only=None):
+        """
+        :param parse_only: bs4.SoupStrainer, only build the matching parts of the page,
+            ignored if `settings.FAST_HTML_PARSING` is disabled
+        """
+        return self.parse_html_soup(self.get_url(url, encoding=encoding), parse_only=parse_only)
+
+    def get_html_soups(self, urls, encoding=None, parse_only=None):
+        """
+        Like `get_html_soup` for several urls that are downloaded at the same time, see `get_urls`
+        :return: list of bs4.BeautifulSoup, in the order of `urls`
+        """
+        return [
+            self.parse_html_soup(text, parse_only=parse_only)
+            for text in self.get_urls(urls, encoding=encoding)
+        ]
+
+    def get_html_details(self, urls, parse_func, max_age=None):
+        """
+        Download and parse the detail pages of places, e.g. in `download_meta_data`.
+
+        The results are kept in ./meta-cache/<source_id>.json and only pages
+        that are new or older than `max_age` seconds are downloaded again.
+
+        :param urls: list of str
+        :param parse_func: callable, gets the bs4.BeautifulSoup of a page
+            and returns json-serializable data
+        :param max_age: float, defaults to `meta_detail_max_age` or `settings.META_DETAIL_MAX_AGE`
+        :return: list of results of `parse_func`, in the order of `urls`
+        """
+        if max_age is None:
+            max_age = self.meta_detail_max_age
+        if max_age is None:
+            max_age = settings.META_DETAIL_MAX_AGE
+
+        urls = list(urls)
+        now = datetime.datetime.now()
+        # replayed responses are always parsed, e.g. in benchmarks
+        cache = self._load_meta_cache() if not self.offline else dict()
+
+        def _is_fresh(entry):
+            age = now - datetime.datetime.fromisoformat(entry["fetched"])
+            return age.total_seconds() <= max_age
+
+        missing_urls = [
+            url for url in dict.fromkeys(urls)
+            if url not in cache or not _is_fresh(cache[url])
+        ]
+        for url, soup in zip(missing_urls, self.get_html_soups(missing_urls)):
+            cache[url] = {"fetched": now.isoformat(), "data": parse_func(soup)}
+
+        if missing_urls and not self.offline:
+            self._store_meta_cache({
+                url: entry
+                for url, entry in cache.items()
+                if url in urls or _is_fresh(entry)
+            })
+
+        return [cache[url]["data"] for url in urls]
+
+    def _load_meta_cache(self):
+        try:
+            with open(self.meta_cache_filename) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return dict()
+
+    def _store_meta_cache(self, cache):
+        os.makedirs(os.path.dirname(self.meta_cache_filename), exist_ok=True)
+        temp_filename = f"{self.meta_cache_filename}.tmp"
+        with open(temp_filename, "w") as fp:
+            json.dump(cache, fp, indent=1)
+        os.replace(temp_filename, self.meta_cache_filename)
+
+    def parse_html_soup(self, text, parse_only=None):
+        if not settings.FAST_HTML_PARSING:
+            parse_only = None
+        soup = bs4.BeautifulSoup(text, parser="html.parser", features="lxml", parse_only=parse_only)
         return soup
 
+    def get_html_tree(self, url, encoding=None):
+        """
+        Faster alternative to `get_html_soup`
+        :return: lxml.html.HtmlElement of the document, use xpath() or find() to navigate
+        """
+        text = self.get_url(url, encoding=encoding)
+        try:
+            return lxml.html.document_fromstring(text)
+        except ValueError:
+            # unicode strings with encoding declaration are not supported by lxml
+            return lxml.html.document_fromstring(text.encode("utf-8"))
+
     def get_xml_data(self, url):
         markup = self.get_url(url)
         return xmljson.parker.data(fromstring(markup))
 
-    def get_cache_filename(self, x):
-        hash = hashlib.md5(str(x).encode("utf-8")).hexdigest()
-        return os.path.join(
-            self.cache_dir,
-            hash,
-        )
+    def get_cache_ttl(self):
+        return self.cache_ttl if self.cache_ttl is not None else settings.RESPONSE_CACHE_TTL
+
+    def get_cache_filename(self, url, method="GET", data=None):
+        return self.response_cache.filename(self.source_id, self.response_cache.get_key(url, method, data))
+
+    @staticmethod
+    def xpath_class(tag, class_name):
+        """
+        :return: str, xpath expression for descendant `tag` elements with css class `class_name`,
+            like bs4's find_all(tag, {"class": class_name})
+        """
+        return f'.//{tag}[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")]'
 
     @staticmethod
     def xml_to_dict(markup):
@@ -181,6 +440,13 @@ class DataSource:
             return None
 
     def place_name_to_id(self, place_name):
+        return _place_name_to_id(self.source_id, str(place_name))
+
+    def reference_place_name_to_id(self, place_name):
+        """
+        The original implementation of `place_name_to_id`,
+        used by the `check-place-ids` command to verify the faster one
+        """
         place_name = str(place_name)
         place_name = place_name.replace("ß", "ss")
         place_name = unicodedata.normalize('NFKD', place_name).encode("ascii", "ignore").decode("ascii")
@@ -281,3 +547,21 @@ class DataSource:
             for key in ("place_url", "address", "coordinates", "num_all"):
                 if not place.get(key):
                     place[key] = None
+
+
+# ascii characters that are kept in place ids, spaces become "-"
+_PLACE_ID_TABLE = {
+    i: chr(i) if chr(i).isalnum() or chr(i) == "\t" else "-"
+    for i in range(128)
+}
+_re_double_minus = re.compile(r"--+")
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def _place_name_to_id(source_id, place_name):
+    if not place_name.isascii():
+        place_name = place_name.replace("ß", "ss")
+        place_name = unicodedata.normalize('NFKD', place_name).encode("ascii", "ignore").decode("ascii")
+
+    place_id = f"{source_id}-{place_name.translate(_PLACE_ID_TABLE)}"
+    return _re_double_minus.sub("-", place_id).strip("-")
@@ -0,0 +1,163 @@
+import os
+import json
+
+import requests
+
+from . import settings
+from ._date import to_utc
+
+
+class InfluxWriter:
+    """
+    Writes points to the influxdb http api in line protocol.
+
+    Points are buffered and posted in batches of `batch_size`. The latest
+    written timestamp of each place is kept in ./influx-state/<database>.json
+    so that subsequent exports only push newer points. Per source it keeps
+    the timestamp up to which all of its places have been exported.
+    """
+
+    MEASUREMENT = "free_parking_spaces"
+
+    def __init__(
+            self, host=None, port=None, user=None, password=None, database=None,
+            batch_size=None, state_path=None,
+    ):
+        self.url = "http://%s:%s" % (host or settings.INFLUX_DB_HOST, port or settings.INFLUX_DB_PORT)
+        self.user = user or settings.INFLUX_DB_USER
+        self.password = password or settings.INFLUX_DB_PASSWORD
+        self.database = database or settings.INFLUX_DB_NAME
+        self.batch_size = batch_size or settings.INFLUX_BATCH_SIZE
+        self.state_filename = os.path.join(
+            state_path or os.path.join(os.path.dirname(os.path.dirname(__file__)), "influx-state"),
+            f"{self.database}.json"
+        )
+        self.session = requests.Session()
+        self.watermarks, self.source_watermarks = self.load_watermarks()
+        self.num_written = 0
+        self._lines = []
+        self._pending_watermarks = dict()
+        self._pending_source_watermarks = dict()
+
+    @classmethod
+    def escape_tag(cls, value):
+        return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+    @classmethod
+    def to_line(cls, tags, value, timestamp):
+        """
+        :param tags: dict
+        :param value: int
+        :param timestamp: naive datetime in server time, as stored
+        :return: str, one point in line protocol with second precision
+        """
+        tags = ",".join(
+            f"{cls.escape_tag(key)}={cls.escape_tag(tag_value)}"
+            for key, tag_value in sorted(tags.items())
+            if tag_value not in (None, "")
+        )
+        return f"{cls.MEASUREMENT},{tags} value={value}i {int(to_utc(timestamp).timestamp())}"
+
+    def load_watermarks(self):
+        """
+        :return: tuple of
+            dict, place_id -> iso timestamp of the latest written point
+            dict, source_id -> iso timestamp up to which all places of the source have been exported
+        """
+        try:
+            with open(self.state_filename) as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            return dict(), dict()
+
+        # previous versions only stored the places
+        if "places" not in state:
+            return state, dict()
+        return state["places"], state.get("sources", dict())
+
+    def store_watermarks(self):
+        os.makedirs(os.path.dirname(self.state_filename), exist_ok=True)
+        temp_filename = f"{self.state_filename}.tmp"
+        with open(temp_filename, "w") as fp:
+            json.dump(
+                {"places": self.watermarks, "sources": self.source_watermarks},
+                fp, indent=1, sort_keys=True,
+            )
+        os.replace(temp_filename, self.state_filename)
+
+    def min_watermark(self, source_id, place_ids):
+        """
+        :param source_id: str
+        :param place_ids: iterable of str, places of the source
+        :return: str, the oldest watermark of the places.
+            Places that have not been written yet had no value until the source's watermark,
+            None if the source has no watermark and any of the places has not been written yet
+        """
+        source_watermark = self.source_watermarks.get(source_id)
+        timestamps = [self.watermarks.get(place_id, source_watermark) for place_id in place_ids]
+        if source_watermark:
+            timestamps.append(source_watermark)
+        if not timestamps or None in timestamps:
+            return None
+        return min(timestamps)
+
+    def set_source_watermark(self, source_id, timestamp):
+        """
+        Mark all places of the source as exported up to timestamp,
+        the watermark is stored with the next `flush`
+        """
+        self._pending_source_watermarks[source_id] = timestamp.isoformat()
+
+    def create_database(self):
+        response = self.session.post(
+            f"{self.url}/query",
+            params={"q": f'CREATE DATABASE "{self.database}"'},
+            auth=(self.user, self.password),
+        )
+        response.raise_for_status()
+
+    def add(self, place_id, tags, value, timestamp):
+        """
+        Buffer one point, points not newer than the place's watermark are ignored
+        :return: bool, True if the point was added
+        """
+        iso_timestamp = timestamp.isoformat()
+        watermark = self.watermarks.get(place_id)
+        if watermark and iso_timestamp <= watermark:
+            return False
+
+        self._lines.append(self.to_line(tags, value, timestamp))
+        pending = self._pending_watermarks.get(place_id)
+        if not pending or iso_timestamp > pending:
+            self._pending_watermarks[place_id] = iso_timestamp
+
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        Post the buffered points and advance the watermarks
+        """
+        if not self._lines:
+            if self._pending_source_watermarks:
+                self.source_watermarks.update(self._pending_source_watermarks)
+                self.store_watermarks()
+                self._pending_source_watermarks = dict()
+            return
+
+        response = self.session.post(
+            f"{self.url}/write",
+            params={"db": self.database, "precision": "s"},
+            auth=(self.user, self.password),
+            data="\n".join(self._lines).encode("utf-8"),
+        )
+        response.raise_for_status()
+
+        self.num_written += len(self._lines)
+        self.watermarks.update(self._pending_watermarks)
+        self.source_watermarks.update(self._pending_source_watermarks)
+        self.store_watermarks()
+        self._lines = []
+        self._pending_watermarks = dict()
+        self._pending_source_watermarks = dict()
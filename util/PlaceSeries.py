@@ -0,0 +1,114 @@
+import array
+import datetime
+
+import numpy as np
+
+
+class PlaceSeries:
+    """
+    Compact time series of `num_free` values of one parking place.
+
+    `timestamps` is a numpy datetime64[s] array, `values` a masked int32 array
+    where masked entries correspond to a `None` value in the snapshot.
+
+    For compatibility with the dict/list based loaders, the series can be indexed
+    like the dicts of `Storage.load_sources_arrays` (`series["x"]`, `series["y"]`)
+    and converted via `to_timestamps()` to the list of `load_sources`.
+    """
+
+    __slots__ = ("place_id", "timestamps", "values")
+
+    def __init__(self, place_id, timestamps, values):
+        self.place_id = place_id
+        self.timestamps = timestamps
+        self.values = values
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.place_id!r}, {len(self)} values)"
+
+    def __getitem__(self, key):
+        if key == "place_id":
+            return self.place_id
+        elif key == "x":
+            return self.timestamps.astype(datetime.datetime).tolist()
+        elif key == "y":
+            return self.values.tolist()
+        raise KeyError(key)
+
+    def __getstate__(self):
+        return self.place_id, self.timestamps, self.values
+
+    def __setstate__(self, state):
+        self.place_id, self.timestamps, self.values = state
+
+    def to_timestamps(self):
+        """
+        :return: list of {"timestamp": datetime, "num_free": int | None}
+        """
+        return [
+            {"timestamp": timestamp, "num_free": value}
+            for timestamp, value in zip(self["x"], self["y"])
+        ]
+
+
+class PlaceSeriesBuilder:
+    """
+    Collects values of one place, either one at a time or as whole numpy arrays
+    """
+
+    __slots__ = ("place_id", "_chunks", "_timestamps", "_values", "_valid")
+
+    def __init__(self, place_id):
+        self.place_id = place_id
+        self._chunks = []
+        self._timestamps = array.array("q")
+        self._values = array.array("l")
+        self._valid = array.array("b")
+
+    def append(self, timestamp, value):
+        """
+        :param timestamp: datetime
+        :param value: int | None
+        """
+        self._timestamps.append(int(np.datetime64(timestamp, "s").astype(np.int64)))
+        self._values.append(value if value is not None else 0)
+        self._valid.append(value is not None)
+
+    def extend(self, timestamps, values, valid):
+        """
+        :param timestamps: np.ndarray of datetime64[s]
+        :param values: np.ndarray of int
+        :param valid: np.ndarray of bool
+        """
+        self._flush()
+        self._chunks.append((timestamps.astype("datetime64[s]"), values.astype(np.int32), valid.astype(bool)))
+
+    def _flush(self):
+        if self._timestamps:
+            self._chunks.append((
+                np.frombuffer(self._timestamps, dtype=np.int64).astype("datetime64[s]"),
+                np.array(self._values, dtype=np.int32),
+                np.frombuffer(self._valid, dtype=np.int8).astype(bool),
+            ))
+            self._timestamps = array.array("q")
+            self._values = array.array("l")
+            self._valid = array.array("b")
+
+    def build(self):
+        """
+        :return: PlaceSeries
+        """
+        self._flush()
+        if self._chunks:
+            timestamps = np.concatenate([c[0] for c in self._chunks])
+            values = np.concatenate([c[1] for c in self._chunks])
+            valid = np.concatenate([c[2] for c in self._chunks])
+        else:
+            timestamps = np.zeros(0, dtype="datetime64[s]")
+            values = np.zeros(0, dtype=np.int32)
+            valid = np.zeros(0, dtype=bool)
+
+        return PlaceSeries(self.place_id, timestamps, np.ma.MaskedArray(values, mask=~valid))
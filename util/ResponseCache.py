@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import threading
+
+from . import settings
+
+
+class ResponseCache:
+    """
+    Responses of `DataSource.get_url` on disk, one file per request in
+    ./cache/<source_id>/<key>.
+
+    Entries older than the ttl of the requesting source are downloaded again.
+    If the total size exceeds `max_size` bytes, the least recently used
+    files are removed. The access time of each file is set on every hit
+    and marks its last use.
+
+    One instance per directory is shared by all sources of a process, see `get_instance`.
+    """
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, max_size=None):
+        """
+        :param path: str, root directory of the cache
+        :param max_size: int, max total bytes, defaults to `settings.RESPONSE_CACHE_MAX_SIZE`,
+            0 or None for no limit
+        """
+        self.path = path
+        self.max_size = settings.RESPONSE_CACHE_MAX_SIZE if max_size is None else max_size
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self._size = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, path=None):
+        path = path or os.path.join(os.path.abspath(os.path.dirname(os.path.dirname(__file__))), "cache")
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @classmethod
+    def get_key(cls, url, method="GET", data=None):
+        """
+        Plain GET requests are keyed by the url only,
+        so entries of previous versions stay valid
+        """
+        if method == "GET" and data is None:
+            x = url
+        else:
+            x = f"{method} {url} {data}"
+        return hashlib.md5(str(x).encode("utf-8")).hexdigest()
+
+    def filename(self, source_id, key):
+        return os.path.join(self.path, source_id, key)
+
+    def get(self, source_id, key, ttl=None):
+        """
+        :param ttl: float, max age in seconds, None for no expiry
+        :return: str or None if not cached or expired
+        """
+        filename = self.filename(source_id, key)
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            self._count("misses")
+            return None
+
+        if ttl is not None and time.time() - stat.st_mtime > ttl:
+            self._count("expired")
+            self._count("misses")
+            return None
+
+        try:
+            with open(filename) as fp:
+                text = fp.read()
+            os.utime(filename, (time.time(), stat.st_mtime))
+        except OSError:
+            # evicted in the meantime
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return text
+
+    def put(self, source_id, key, text):
+        filename = self.filename(source_id, key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        try:
+            old_size = os.path.getsize(filename)
+        except OSError:
+            old_size = 0
+
+        temp_filename = f"{filename}.{threading.get_ident()}.tmp"
+        with open(temp_filename, "w") as fp:
+            fp.write(text)
+        new_size = os.path.getsize(temp_filename)
+        os.replace(temp_filename, filename)
+
+        if self.max_size:
+            with self._lock:
+                if self._size is None:
+                    self._size = self._scan_size()
+                else:
+                    self._size += new_size - old_size
+                if self._size > self.max_size:
+                    self._evict()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _iter_files(self):
+        if not os.path.exists(self.path):
+            return
+        for root, dirs, files in os.walk(self.path):
+            for fn in files:
+                if not fn.endswith(".tmp"):
+                    yield os.path.join(root, fn)
+
+    def _scan_size(self):
+        size = 0
+        for filename in self._iter_files():
+            try:
+                size += os.path.getsize(filename)
+            except OSError:
+                pass
+        return size
+
+    def _evict(self):
+        """
+        Remove least recently used files until the cache uses 90% of `max_size`
+        """
+        entries = []
+        for filename in self._iter_files():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, filename))
+
+        self._size = sum(entry[1] for entry in entries)
+        for atime, size, filename in sorted(entries):
+            if self._size <= self.max_size * .9:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            self._size -= size
+            self.stats["evicted"] += 1
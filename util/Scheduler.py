@@ -0,0 +1,123 @@
+import time
+import math
+import random
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScheduledJob:
+    """
+    A blocking function that is called repeatedly by the `Scheduler`.
+
+    After an error the next call is delayed exponentially,
+    up to `max_backoff` seconds.
+
+    In adaptive mode the interval is derived from how often the result
+    of `func` changed at the current hour of day in the past,
+    between `min_interval` and `max_interval`.
+    """
+
+    def __init__(
+            self, name, func, interval, jitter=.1, max_backoff=3600,
+            adaptive=False, min_interval=None, max_interval=None, adapt_rate=.3,
+    ):
+        """
+        :param name: str, for logging
+        :param func: callable without arguments, raises on errors,
+            returns a comparable result or None if the result is known to be unchanged
+        :param interval: float, seconds between two calls
+        :param jitter: float, random deviation of the interval as fraction
+        :param max_backoff: float, max seconds between two calls after errors
+        :param adaptive: bool, adapt the interval to the change rate of the results
+        :param min_interval: float, smallest interval in adaptive mode
+        :param max_interval: float, largest interval in adaptive mode
+        :param adapt_rate: float, weight of the latest result in the change rate average
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.adaptive = adaptive
+        self.min_interval = min(interval, min_interval or interval)
+        self.max_interval = max(interval, max_interval or interval)
+        self.adapt_rate = adapt_rate
+        self.num_errors = 0
+        self.last_result = None
+
+        # the change rate that results in the base interval
+        initial_rate = .5
+        if self.max_interval > self.min_interval:
+            initial_rate = 1. - math.log(interval / self.min_interval) / math.log(self.max_interval / self.min_interval)
+        self.hourly_change_rate = [initial_rate] * 24
+
+    def update(self, result):
+        """
+        Update the change rate of the current hour with the result of `func`
+        """
+        changed = result is not None and result != self.last_result
+        if result is not None:
+            self.last_result = result
+
+        hour = datetime.datetime.now().hour
+        self.hourly_change_rate[hour] += self.adapt_rate * (float(changed) - self.hourly_change_rate[hour])
+
+    def current_interval(self):
+        if not self.adaptive or self.max_interval <= self.min_interval:
+            return self.interval
+
+        rate = self.hourly_change_rate[datetime.datetime.now().hour]
+        return self.min_interval * (self.max_interval / self.min_interval) ** (1. - rate)
+
+    def next_delay(self):
+        """
+        Return seconds until the next call
+        """
+        delay = self.current_interval()
+        if self.num_errors:
+            delay = max(delay, min(self.max_backoff, delay * 2 ** self.num_errors))
+        return delay * (1. + random.uniform(-self.jitter, self.jitter))
+
+
+class Scheduler:
+    """
+    Runs each `ScheduledJob` in its own interval in worker threads of a single process
+    """
+
+    def __init__(self, jobs, concurrency=8):
+        """
+        :param jobs: list of ScheduledJob
+        :param concurrency: int, max number of jobs running at the same time
+        """
+        self.jobs = jobs
+        self.concurrency = concurrency
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(
+                self._run_job(job, loop, executor, semaphore)
+                for job in self.jobs
+            ))
+
+    async def _run_job(self, job, loop, executor, semaphore):
+        # spread the first runs over the interval
+        await asyncio.sleep(random.uniform(0, job.interval * job.jitter))
+
+        while True:
+            start_time = time.monotonic()
+            try:
+                async with semaphore:
+                    result = await loop.run_in_executor(executor, job.func)
+                job.num_errors = 0
+                job.update(result)
+
+            except Exception as e:
+                job.num_errors += 1
+
+            delay = job.next_delay()
+            print(f"{datetime.datetime.now().isoformat()} {job.name}: next run in {delay:.0f} seconds")
+            await asyncio.sleep(max(0., delay - (time.monotonic() - start_time)))
@@ -1,14 +1,60 @@
 import os
+import io
+import sys
+import gzip
 import json
 import datetime
 import traceback
+import bisect
+import heapq
+from multiprocessing import Pool
+from functools import partial
+from collections import deque
 
+import numpy as np
 import tqdm
 
+from . import settings
+from .PlaceSeries import PlaceSeriesBuilder
+from ._resample import AGGREGATIONS, resample_series
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# state after the last record of each delta file, filename -> (size, keyframe timestamp, places),
+# kept per process because a new `Storage` is created for each download
+_delta_states = dict()
+
 
 class Storage:
 
-    def __init__(self):
+    # file extension per compression type
+    EXTENSIONS = {
+        None: "json",
+        "gzip": "json.gz",
+        "zstd": "json.zst",
+    }
+
+    def __init__(self, use_canonical_cache=None, compression=None, delta=None):
+        """
+        :param use_canonical_cache: bool, keep the transformed snapshot data on disk,
+            defaults to `settings.CANONICAL_CACHE`
+        :param compression: str, None, "gzip" or "zstd", compression of newly stored files,
+            defaults to `settings.SNAPSHOT_COMPRESSION`
+        :param delta: bool, store snapshots as change-only records, see `store_delta`,
+            defaults to `settings.SNAPSHOT_DELTA`
+        """
+        self.compression = compression or settings.SNAPSHOT_COMPRESSION
+        self.delta = settings.SNAPSHOT_DELTA if delta is None else delta
+        if self.compression not in self.EXTENSIONS:
+            raise ValueError(f"Invalid compression '{self.compression}', expected one of {list(self.EXTENSIONS)}")
+        if self.compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression needs the 'zstandard' package")
+        self.use_canonical_cache = settings.CANONICAL_CACHE if use_canonical_cache is None else use_canonical_cache
+        self._catalogs = dict()
         self.directories = {
             "snapshot": os.path.join(
                 os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
@@ -21,9 +67,36 @@ class Storage:
             "error": os.path.join(
                 os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
                 "errors",
-            )
+            ),
+            "compact": os.path.join(
+                os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+                "snapshots-compact",
+            ),
+            "delta": os.path.join(
+                os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+                "snapshots-delta",
+            ),
+            "canonical": os.path.join(
+                os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+                "cache-canonical",
+            ),
+            "catalog": os.path.join(
+                os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+                "cache-catalog",
+            ),
+            "rollup": os.path.join(
+                os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+                "rollups",
+            ),
         }
 
+    def __getstate__(self):
+        # instances are sent to worker processes with each task,
+        # the catalogs are loaded again from disk when needed
+        state = self.__dict__.copy()
+        state["_catalogs"] = dict()
+        return state
+
     @classmethod
     def timestamp_to_filename(cls, timestamp, ext=None):
         fn = timestamp.strftime("%Y-%m-%d-%H-%M-%S")
@@ -35,6 +108,60 @@ class Storage:
     def filename_to_timestamp(cls, fn):
         return datetime.datetime.strptime(fn[:19], "%Y-%m-%d-%H-%M-%S")
 
+    @classmethod
+    def is_data_filename(cls, fn):
+        return fn.endswith(".json") or fn.endswith(".json.gz") or fn.endswith(".json.zst")
+
+    @classmethod
+    def load_json(cls, filename):
+        """
+        Load a plain, gzip or zstd compressed json file
+        """
+        if filename.endswith(".gz"):
+            with gzip.open(filename, "rt", encoding="utf-8") as fp:
+                return json.load(fp)
+
+        elif filename.endswith(".zst"):
+            if zstandard is None:
+                raise ImportError(f"Can not read {filename}, need the 'zstandard' package")
+            with open(filename, "rb") as fp:
+                with zstandard.ZstdDecompressor().stream_reader(fp) as reader:
+                    return json.load(io.TextIOWrapper(reader, encoding="utf-8"))
+
+        with open(filename) as fp:
+            return json.load(fp)
+
+    @classmethod
+    def dump_json(cls, filename, data, compression=None):
+        """
+        Write a json file
+        :param compression: str, None, "gzip" or "zstd"
+        """
+        if compression == "gzip":
+            with gzip.open(filename, "wt", encoding="utf-8") as fp:
+                json.dump(data, fp)
+
+        elif compression == "zstd":
+            with open(filename, "wb") as fp:
+                fp.write(zstandard.ZstdCompressor().compress(json.dumps(data).encode("utf-8")))
+
+        else:
+            with open(filename, "w") as fp:
+                json.dump(data, fp, indent=1)
+
+    @classmethod
+    def month_range(cls, month):
+        """
+        Return first and last possible timestamp of a "YYYY-MM" string
+        :return: tuple of datetime
+        """
+        start = datetime.datetime.strptime(month, "%Y-%m")
+        if start.month == 12:
+            end = start.replace(year=start.year + 1, month=1)
+        else:
+            end = start.replace(month=start.month + 1)
+        return start, end - datetime.timedelta(microseconds=1)
+
     def store(self, source_id, timestamp, data, type):
         """
         Store json data for source_id
@@ -43,6 +170,19 @@ class Storage:
         :param data: dict | list
         :param type: "snapshot", "meta", "error"
         """
+        if type == "snapshot" and self.delta:
+            from .DataSource import DataSources
+            try:
+                canonical_data = DataSources.create(source_id).transform_snapshot_data(data)
+            except Exception as e:
+                # keep the raw data if it can not be transformed
+                print(f"{source_id}: can not store delta, keeping raw snapshot: {e.__class__.__name__}: {e}")
+            else:
+                if self.store_delta(source_id, timestamp, canonical_data):
+                    print("writing", self.delta_filename(source_id, timestamp.strftime("%Y-%m")))
+                self.store_latest_snapshot(source_id, timestamp, data)
+                return
+
         file_path = os.path.join(
             self.directories[type],
             source_id,
@@ -51,12 +191,23 @@ class Storage:
         if not os.path.exists(file_path):
             os.makedirs(file_path)
 
-        filename = self.timestamp_to_filename(timestamp, "json")
+        filename = self.timestamp_to_filename(timestamp, self.EXTENSIONS[self.compression])
         long_filename = os.path.join(file_path, filename)
 
+        month = timestamp.strftime("%Y-%m")
+        month_entry = self.load_catalog(source_id, month, type)
+        if month_entry and month_entry["mtime"] != os.stat(file_path).st_mtime_ns:
+            month_entry = None
+
         print("writing", long_filename)
-        with open(long_filename, "w") as fp:
-            json.dump(data, fp, indent=1)
+        self.dump_json(long_filename, data, self.compression)
+
+        # keep the catalog up-to-date without rescanning the directory
+        if month_entry:
+            if filename not in month_entry["files"]:
+                bisect.insort(month_entry["files"], filename)
+            month_entry["mtime"] = os.stat(file_path).st_mtime_ns
+            self.store_catalog(source_id, month, type, month_entry)
 
     def find_files(self, source_id, min_timestamp=None, max_timestamp=None, type="snapshot"):
         """
@@ -71,20 +222,11 @@ class Storage:
             "filename": str,        # absolute filename
         }
         """
-        path = os.path.join(self.directories[type], source_id)
         ret_files = []
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if file.endswith(".json"):
-                    timestamp = self.filename_to_timestamp(file)
-                    if not min_timestamp or timestamp >= min_timestamp:
-                        if not max_timestamp or timestamp <= max_timestamp:
-                            ret_files.append({
-                                "filename": os.path.join(root, file),
-                                "timestamp": timestamp,
-                            })
-
-        ret_files.sort(key=lambda f: f["timestamp"])
+        for month in self.find_months(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp, type=type):
+            ret_files += self._find_month_files(
+                source_id, month, min_timestamp=min_timestamp, max_timestamp=max_timestamp, type=type
+            )
         return ret_files
 
     def load_files(self, source_id, min_timestamp=None, max_timestamp=None, type="snapshot"):
@@ -102,20 +244,40 @@ class Storage:
             "data": list            # actual data content of snapshot
         }
         """
-        files = self.find_files(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp, type=type)
-        out_files = []
+        return list(self.iter_snapshots(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp, type=type))
 
-        for file in files:
-            try:
-                with open(file["filename"]) as fp:
-                    file["data"] = json.load(fp)
-                out_files.append(file)
+    def iter_snapshots(self, source_id, min_timestamp=None, max_timestamp=None, type="snapshot"):
+        """
+        Like `load_files` but yields one loaded file at a time in timestamp order
+        :return: generator of dict
+        """
+        for file in self.find_files(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp, type=type):
+            yield from self._load_file_list([file])
 
-            except BaseException as e:
-                #print(f"error: {file['filename']}: {e.__class__.__name__}: {e}")
-                pass
+    def iter_canonical(self, sources, min_timestamp=None, max_timestamp=None, source_id_to_min_timestamp=None):
+        """
+        Yield canonical snapshot data of all sources, one snapshot at a time, in timestamp order
+        :param sources: DataSources instance
+        :param source_id_to_min_timestamp: dict, source_id -> datetime or None,
+            overrides min_timestamp for the contained sources
+        :return: generator of tuple (datetime, source_id, list of dict)
+        """
+        from .DataSource import DataSources
 
-        return out_files
+        def _iter_source(source_id):
+            data_source = DataSources.create(source_id)
+            source_min_timestamp = min_timestamp
+            if source_id_to_min_timestamp and source_id in source_id_to_min_timestamp:
+                source_min_timestamp = source_id_to_min_timestamp[source_id]
+            for timestamp, canonical_data in self.iter_source_canonical(
+                    data_source, min_timestamp=source_min_timestamp, max_timestamp=max_timestamp
+            ):
+                yield timestamp, source_id, canonical_data
+
+        yield from heapq.merge(
+            *(_iter_source(attributes["source_id"]) for attributes in sources.sources),
+            key=lambda snapshot: snapshot[0],
+        )
 
     def load_meta(self, source_id):
         """
@@ -126,50 +288,835 @@ class Storage:
         if not files:
             return None
 
-        with open(files[-1]["filename"]) as fp:
-            return json.load(fp)
+        return self.load_json(files[-1]["filename"])
         # TODO might return the latest 'valid' data here
 
-    def load_sources(self, sources, min_timestamp=None, max_timestamp=None):
-        from .DataSource import DataSources
+    def find_months(self, source_id, min_timestamp=None, max_timestamp=None, type="snapshot"):
+        """
+        Find all "YYYY-MM" directories of the given source that
+        may contain timestamps within the given range
+        :return: list of str, sorted
+        """
+        names = []
+        path = os.path.join(self.directories[type], source_id)
+        if os.path.exists(path):
+            names += os.listdir(path)
+        if type == "snapshot":
+            names += self.find_delta_months(source_id)
 
-        place_id_to_timestamps = dict()
+        months = []
+        for name in set(names):
+            try:
+                start, end = self.month_range(name)
+            except ValueError:
+                continue
+            if min_timestamp and end < min_timestamp:
+                continue
+            if max_timestamp and start > max_timestamp:
+                continue
+            months.append(name)
+
+        return sorted(months)
+
+    def _find_month_files(self, source_id, month, min_timestamp=None, max_timestamp=None, type="snapshot"):
+        """
+        Like `find_files` but only looks into a single month directory.
+        Uses the catalog to avoid listing and parsing every file in the directory.
+        """
+        path = os.path.join(self.directories[type], source_id, month)
+        filenames = self._catalog_month_files(source_id, month, type)
+
+        start_index, end_index = 0, len(filenames)
+        if min_timestamp:
+            start_index = bisect.bisect_left(filenames, self.timestamp_to_filename(min_timestamp))
+        if max_timestamp:
+            # '~' sorts after any file extension
+            end_index = bisect.bisect_right(filenames, self.timestamp_to_filename(max_timestamp) + "~")
+
+        ret_files = []
+        for file in filenames[start_index:end_index]:
+            timestamp = self.filename_to_timestamp(file)
+            if not min_timestamp or timestamp >= min_timestamp:
+                if not max_timestamp or timestamp <= max_timestamp:
+                    ret_files.append({
+                        "filename": os.path.join(path, file),
+                        "timestamp": timestamp,
+                    })
+
+        return ret_files
+
+    def catalog_filename(self, source_id, month, type="snapshot"):
+        return os.path.join(self.directories["catalog"], type, source_id, f"{month}.json")
+
+    def load_catalog(self, source_id, month, type="snapshot"):
+        """
+        Load the file catalog of one month of a source
+        :return: dict or None
+            {"mtime": int, "files": [str, ...]}
+            where `mtime` is the nanosecond modification time of the month directory
+            and `files` the sorted list of snapshot filenames in it
+        """
+        key = (type, source_id, month)
+        if key not in self._catalogs:
+            try:
+                with open(self.catalog_filename(source_id, month, type)) as fp:
+                    self._catalogs[key] = json.load(fp)
+            except (OSError, ValueError):
+                self._catalogs[key] = None
+
+        return self._catalogs[key]
+
+    def store_catalog(self, source_id, month, type, month_entry):
+        self._catalogs[(type, source_id, month)] = month_entry
+        filename = self.catalog_filename(source_id, month, type)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, "w") as fp:
+            json.dump(month_entry, fp)
+        os.replace(temp_filename, filename)
+
+    def _catalog_month_files(self, source_id, month, type="snapshot"):
+        """
+        Return sorted filenames of a month directory,
+        rescanning the directory only if it's modification time changed
+        """
+        path = os.path.join(self.directories[type], source_id, month)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
 
+        month_entry = self.load_catalog(source_id, month, type)
+        if not month_entry or month_entry["mtime"] != mtime:
+            timestamp_to_file = dict()
+            # if a file exists plain and compressed (interrupted `compress_source`)
+            # the compressed one is sorted last and used
+            for file in sorted(os.listdir(path)):
+                if self.is_data_filename(file):
+                    timestamp_to_file[file[:19]] = file
+
+            month_entry = {
+                "mtime": mtime,
+                "files": sorted(timestamp_to_file.values()),
+            }
+            self.store_catalog(source_id, month, type, month_entry)
+
+        return month_entry["files"]
+
+    def _load_file_list(self, files):
+        out_files = []
+        for file in files:
+            try:
+                file["data"] = self.load_json(file["filename"])
+                out_files.append(file)
+
+            except BaseException as e:
+                pass
+
+        return out_files
+
+    def _transform_snapshot(self, data_source, file):
+        """
+        Return canonical data of a loaded snapshot file
+        :param data_source: DataSource instance
+        :param file: dict, as returned by `load_files`
+        :return: list of dict
+        """
+        snapshot_data = file["data"]
+
+        # fix previous storage bug
+        if isinstance(snapshot_data, dict):
+            try:
+                snapshot_data = snapshot_data[data_source.source_id]
+            except KeyError:
+                pass
+
+        try:
+            return data_source.transform_snapshot_data(snapshot_data)
+        except BaseException as e:
+            raise ValueError(
+                f"{data_source.__class__.__name__}.transform_snapshot_data() failed "
+                f"for timestamp {file['timestamp']}: "
+                f"{e.__class__.__name__}: {e}\n{traceback.format_exc()}")
+
+    def compress_source(self, source_id, type="snapshot"):
+        """
+        Convert all stored files of a source to the compression of this Storage instance.
+        Modification times are kept.
+        :return: int, number of converted files
+        """
+        extension = "." + self.EXTENSIONS[self.compression]
+        num_converted = 0
+        for file in self.find_files(source_id, type=type):
+            filename = file["filename"]
+            if filename.endswith(extension):
+                continue
+
+            new_filename = os.path.join(
+                os.path.dirname(filename),
+                self.timestamp_to_filename(file["timestamp"], self.EXTENSIONS[self.compression])
+            )
+            try:
+                data = self.load_json(filename)
+            except ValueError:
+                print(f"skipping invalid file {filename}")
+                continue
+
+            stat = os.stat(filename)
+            temp_filename = f"{new_filename}.tmp"
+            self.dump_json(temp_filename, data, self.compression)
+            os.replace(temp_filename, new_filename)
+            os.utime(new_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.remove(filename)
+            num_converted += 1
+
+        return num_converted
+
+    def compress_sources(self, sources):
         for attributes in tqdm.tqdm(sources.sources):
-            source_id = attributes["source_id"]
+            for type in ("snapshot", "meta", "error"):
+                num_converted = self.compress_source(attributes["source_id"], type=type)
+                if num_converted:
+                    print(f"converted {num_converted} {type} files of {attributes['source_id']}")
 
-            files = self.load_files(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp)
-            data_source = DataSources.create(source_id)
+    def canonical_cache_filename(self, source_id, month):
+        return os.path.join(self.directories["canonical"], source_id, f"{month}.json")
+
+    def load_canonical_cache(self, source_id, month):
+        """
+        Load the canonical data cache of one month
+        :return: dict, timestamp part of snapshot filename -> [mtime, size, transform_version, [[place_id, num_free], ...]]
+        """
+        try:
+            with open(self.canonical_cache_filename(source_id, month)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return dict()
+
+    def store_canonical_cache(self, source_id, month, cache):
+        filename = self.canonical_cache_filename(source_id, month)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # write to temp file first so concurrent readers never see a partial file
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, "w") as fp:
+            json.dump(cache, fp)
+        os.replace(temp_filename, filename)
+
+    def _iter_files_canonical(self, data_source, month, files):
+        """
+        Yield canonical data of the given snapshot files of one month.
+
+        If the canonical cache is enabled, a file is only loaded and transformed
+        when its mtime, size or the `transform_version` of the source changed.
 
+        :return: generator of tuple (datetime, list of dict)
+        """
+        if not self.use_canonical_cache:
+            for file in self._load_file_list(files):
+                yield file["timestamp"], self._transform_snapshot(data_source, file)
+            return
+
+        source_id = data_source.source_id
+        version = data_source.transform_version
+        cache = self.load_canonical_cache(source_id, month)
+        cache_changed = False
+
+        try:
             for file in files:
-                snapshot_data = file["data"]
+                try:
+                    stat = os.stat(file["filename"])
+                except OSError:
+                    continue
+
+                # same key for the plain and compressed file of a snapshot
+                key = os.path.basename(file["filename"])[:19]
+                entry = cache.get(key)
+                if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size and entry[2] == version:
+                    yield file["timestamp"], [
+                        {"place_id": place_id, "num_free": num_free}
+                        for place_id, num_free in entry[3]
+                    ]
+                    continue
+
+                loaded_files = self._load_file_list([file])
+                if not loaded_files:
+                    continue
 
-                # fix previous storage bug
-                if isinstance(snapshot_data, dict):
-                    try:
-                        snapshot_data = snapshot_data[data_source.source_id]
-                    except KeyError:
-                        pass
+                canonical_data = self._transform_snapshot(data_source, loaded_files[0])
+                cache[key] = [
+                    stat.st_mtime, stat.st_size, version,
+                    [[data["place_id"], data["num_free"]] for data in canonical_data]
+                ]
+                cache_changed = True
+                yield file["timestamp"], canonical_data
 
+        finally:
+            if cache_changed:
+                # drop entries of removed files
+                keys = set(fn[:19] for fn in self._catalog_month_files(source_id, month))
+                cache = {key: entry for key, entry in cache.items() if key in keys}
+                self.store_canonical_cache(source_id, month, cache)
+
+    def delta_filename(self, source_id, month):
+        return os.path.join(self.directories["delta"], source_id, f"{month}.jsonl")
+
+    def find_delta_months(self, source_id):
+        path = os.path.join(self.directories["delta"], source_id)
+        if not os.path.exists(path):
+            return []
+        return sorted(
+            name[:-6]
+            for name in os.listdir(path)
+            if name.endswith(".jsonl")
+        )
+
+    def latest_snapshot_filename(self, source_id):
+        return os.path.join(self.directories["delta"], source_id, "latest.json")
+
+    def store_latest_snapshot(self, source_id, timestamp, data):
+        """
+        Keep the raw data of the latest delta-stored snapshot,
+        it replaces the json files as fallback for missing meta-data
+        """
+        filename = self.latest_snapshot_filename(source_id)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "w") as fp:
+            json.dump({"timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S"), "data": data}, fp)
+        os.replace(temp_filename, filename)
+
+    def load_latest_snapshot(self, source_id):
+        """
+        :return: tuple of (datetime, raw snapshot data) or None
+        """
+        try:
+            with open(self.latest_snapshot_filename(source_id)) as fp:
+                latest = json.load(fp)
+            return datetime.datetime.strptime(latest["timestamp"], "%Y-%m-%dT%H:%M:%S"), latest["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _iter_delta_records(self, source_id, month):
+        """
+        Yield the records of a delta file, lines that can not be decoded
+        (e.g. after an interrupted write) are skipped
+        :return: generator of dict
+        """
+        filename = self.delta_filename(source_id, month)
+        if not os.path.exists(filename):
+            return
+
+        with open(filename) as fp:
+            for line in fp:
                 try:
-                    file["canonical_data"] = data_source.transform_snapshot_data(snapshot_data)
-                except BaseException as e:
-                    raise ValueError(
-                        f"{data_source.__class__.__name__}.transform_snapshot_data() failed "
-                        f"for timestamp {file['timestamp']}: "
-                        f"{e.__class__.__name__}: {e}\n{traceback.format_exc()}")
-
-                for data in file["canonical_data"]:
+                    record = json.loads(line)
+                    record["timestamp"] = datetime.datetime.strptime(record["timestamp"], "%Y-%m-%dT%H:%M:%S")
+                except (ValueError, KeyError, TypeError):
+                    continue
+                yield record
+
+    def iter_delta_timestamps(self, source_id, month, min_timestamp=None, max_timestamp=None):
+        """
+        Yield the timestamps of all records in a delta file
+        :return: generator of datetime
+        """
+        for record in self._iter_delta_records(source_id, month):
+            if min_timestamp and record["timestamp"] < min_timestamp:
+                continue
+            if max_timestamp and record["timestamp"] > max_timestamp:
+                break
+            yield record["timestamp"]
+
+    def month_last_timestamp(self, source_id, month):
+        """
+        :return: datetime of the latest json or delta snapshot of the month, None if there is none
+        """
+        files = self._find_month_files(source_id, month)
+        last_timestamp = files[-1]["timestamp"] if files else None
+        for timestamp in self.iter_delta_timestamps(source_id, month):
+            if last_timestamp is None or timestamp > last_timestamp:
+                last_timestamp = timestamp
+        return last_timestamp
+
+    def iter_delta(self, source_id, month, min_timestamp=None, max_timestamp=None):
+        """
+        Reconstruct the canonical data from the change-only records of one month.
+
+        One snapshot is yielded per record, the values of unchanged places
+        are carried over from the previous record, so the result is the
+        full step series of each place.
+
+        :return: generator of tuple (datetime, list of dict)
+        """
+        state = dict()
+        for record in self._iter_delta_records(source_id, month):
+            if record.get("keyframe"):
+                state = dict()
+            state.update(record["places"])
+            for place_id in record.get("removed", []):
+                state.pop(place_id, None)
+
+            if min_timestamp and record["timestamp"] < min_timestamp:
+                continue
+            if max_timestamp and record["timestamp"] > max_timestamp:
+                break
+
+            yield record["timestamp"], [
+                {"place_id": place_id, "num_free": num_free}
+                for place_id, num_free in state.items()
+            ]
+
+    def _load_delta_state(self, source_id, month):
+        """
+        :return: tuple of (datetime of last keyframe or None, dict of place_id -> num_free)
+        """
+        filename = self.delta_filename(source_id, month)
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+
+        cached = _delta_states.get(filename)
+        if cached and cached[0] == size:
+            return cached[1], cached[2]
+
+        keyframe_timestamp, state = None, dict()
+        for record in self._iter_delta_records(source_id, month):
+            if record.get("keyframe"):
+                keyframe_timestamp, state = record["timestamp"], dict()
+            state.update(record["places"])
+            for place_id in record.get("removed", []):
+                state.pop(place_id, None)
+
+        return keyframe_timestamp, state
+
+    def store_delta(self, source_id, timestamp, canonical_data):
+        """
+        Append the canonical data of a snapshot to the monthly delta file of the source.
+
+        Only places whose value changed since the previous record are written.
+        A full record (keyframe) is written with the first snapshot of each day and after
+        `settings.SNAPSHOT_KEYFRAME_INTERVAL` seconds, so a damaged record only
+        affects the data until the next keyframe and a missing keyframe
+        marks a gap in the downloads.
+
+        :param canonical_data: list of dict, result of `DataSource.transform_snapshot_data`
+        :return: bool, True if a record was written
+        """
+        month = timestamp.strftime("%Y-%m")
+        keyframe_timestamp, state = self._load_delta_state(source_id, month)
+
+        places = {
+            data["place_id"]: data["num_free"]
+            for data in canonical_data
+        }
+
+        record = {"timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S")}
+        if keyframe_timestamp is None or keyframe_timestamp.date() != timestamp.date() or (
+                timestamp - keyframe_timestamp).total_seconds() >= settings.SNAPSHOT_KEYFRAME_INTERVAL:
+            record["keyframe"] = True
+            record["places"] = places
+            keyframe_timestamp = timestamp
+        else:
+            record["places"] = {
+                place_id: num_free
+                for place_id, num_free in places.items()
+                if place_id not in state or state[place_id] != num_free
+            }
+            removed = [place_id for place_id in state if place_id not in places]
+            if removed:
+                record["removed"] = removed
+            if not record["places"] and not removed:
+                return False
+
+        filename = self.delta_filename(source_id, month)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "a+b") as fp:
+            line = json.dumps(record).encode("utf-8") + b"\n"
+            # start a new line if a previous write was interrupted
+            if fp.tell():
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":
+                    line = b"\n" + line
+            fp.write(line)
+            size = fp.tell()
+
+        _delta_states[filename] = (size, keyframe_timestamp, places)
+        return True
+
+    def compact_filename(self, source_id, month):
+        return os.path.join(self.directories["compact"], source_id, f"{month}.npz")
+
+    def load_compact(self, source_id, month, transform_version=None):
+        """
+        Load the compacted canonical data of one month
+        :param transform_version: int, if given, data compacted with another
+            `DataSource.transform_version` is ignored
+        :return: dict or None
+        {
+            "transform_version": np.ndarray of int,         # shape ()
+            "timestamps": np.ndarray of datetime64[s],      # shape (T,)
+            "place_ids": np.ndarray of str,                 # shape (P,)
+            "num_free": np.ndarray of int32,                # shape (P, T)
+            "present": np.ndarray of bool,                  # shape (P, T), place is in snapshot
+            "valid": np.ndarray of bool,                    # shape (P, T), num_free is not None
+        }
+        """
+        filename = self.compact_filename(source_id, month)
+        if not os.path.exists(filename):
+            return None
+
+        with np.load(filename) as data:
+            if transform_version is not None:
+                if "transform_version" not in data.files or int(data["transform_version"]) != transform_version:
+                    return None
+            return {key: data[key] for key in data.files}
+
+    def compact_source(self, source_id):
+        """
+        Convert the json and delta snapshots of a source into monthly columnar files
+        in the `compact` directory.
+
+        Months that are already compacted up to their latest snapshot
+        with the current `transform_version` are skipped.
+        :return: int, number of written months
+        """
+        from .DataSource import DataSources
+
+        data_source = DataSources.create(source_id)
+        num_written = 0
+
+        for month in self.find_months(source_id):
+            last_timestamp = self.month_last_timestamp(source_id, month)
+            if last_timestamp is None:
+                continue
+
+            compact = self.load_compact(source_id, month, data_source.transform_version)
+            if compact is not None and len(compact["timestamps"]):
+                if compact["timestamps"][-1] >= np.datetime64(last_timestamp, "s"):
+                    continue
+
+            month_start, month_end = self.month_range(month)
+            timestamps = []
+            place_id_to_index = dict()
+            columns = []
+            for timestamp, canonical_data in self.iter_source_canonical(
+                    data_source, month_start, month_end, use_compact=False
+            ):
+                column = dict()
+                for entry in canonical_data:
+                    if entry["place_id"] not in place_id_to_index:
+                        place_id_to_index[entry["place_id"]] = len(place_id_to_index)
+                    column[place_id_to_index[entry["place_id"]]] = entry["num_free"]
+                timestamps.append(timestamp)
+                columns.append(column)
+
+            num_free = np.zeros((len(place_id_to_index), len(timestamps)), dtype=np.int32)
+            present = np.zeros(num_free.shape, dtype=bool)
+            valid = np.zeros(num_free.shape, dtype=bool)
+            for x, column in enumerate(columns):
+                for y, value in column.items():
+                    present[y, x] = True
+                    if value is not None:
+                        valid[y, x] = True
+                        num_free[y, x] = value
+
+            filename = self.compact_filename(source_id, month)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            np.savez_compressed(
+                filename,
+                transform_version=np.array(data_source.transform_version),
+                timestamps=np.array(timestamps, dtype="datetime64[s]"),
+                place_ids=np.array(list(place_id_to_index), dtype=str),
+                num_free=num_free,
+                present=present,
+                valid=valid,
+            )
+            num_written += 1
+
+        return num_written
+
+    def compact_sources(self, sources):
+        for attributes in tqdm.tqdm(sources.sources):
+            num_written = self.compact_source(attributes["source_id"])
+            if num_written:
+                print(f"compacted {num_written} month(s) of {attributes['source_id']}")
+
+    def _iter_source_blocks(self, data_source, min_timestamp=None, max_timestamp=None, use_compact=True):
+        """
+        Yield the data of one source in timestamp order, either as
+            ("compact", compact_dict, indices)
+        for a slice of compacted month data (see `load_compact`) or as
+            ("snapshot", timestamp, canonical_data)
+        for a single json or delta snapshot.
+        """
+        source_id = data_source.source_id
+
+        for month in self.find_months(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp):
+            month_start, month_end = self.month_range(month)
+            json_min_timestamp = max(month_start, min_timestamp) if min_timestamp else month_start
+            json_max_timestamp = min(month_end, max_timestamp) if max_timestamp else month_end
+
+            # months compacted with an older transform are read from the json files
+            compact = self.load_compact(source_id, month, data_source.transform_version) if use_compact else None
+            if compact is not None and len(compact["timestamps"]):
+                timestamps = compact["timestamps"]
+                indices = np.arange(len(timestamps))
+                if min_timestamp:
+                    indices = indices[timestamps[indices] >= np.datetime64(min_timestamp, "s")]
+                if max_timestamp:
+                    indices = indices[timestamps[indices] <= np.datetime64(max_timestamp, "s")]
+
+                yield "compact", compact, indices
+
+                json_min_timestamp = max(
+                    json_min_timestamp,
+                    timestamps[-1].astype(datetime.datetime) + datetime.timedelta(seconds=1),
+                )
+
+            files = self._find_month_files(
+                source_id, month, min_timestamp=json_min_timestamp, max_timestamp=json_max_timestamp
+            )
+            for timestamp, canonical_data in heapq.merge(
+                    self._iter_files_canonical(data_source, month, files),
+                    self.iter_delta(source_id, month, json_min_timestamp, json_max_timestamp),
+                    key=lambda snapshot: snapshot[0],
+            ):
+                yield "snapshot", timestamp, canonical_data
+
+    def iter_source_canonical(self, data_source, min_timestamp=None, max_timestamp=None, use_compact=True):
+        """
+        Yield canonical snapshot data of one source in timestamp order.
+
+        Compacted months are read from the `compact` directory, json files
+        and delta records are only loaded for snapshots newer than the compacted data.
+
+        :param data_source: DataSource instance
+        :param use_compact: bool, False to ignore the compacted data
+        :return: generator of tuple (datetime, list of dict)
+        """
+        for block_type, *block in self._iter_source_blocks(data_source, min_timestamp, max_timestamp, use_compact):
+            if block_type == "snapshot":
+                yield block[0], block[1]
+                continue
+
+            compact, indices = block
+            place_ids = compact["place_ids"].tolist()
+            for x in indices:
+                canonical_data = []
+                for y in np.flatnonzero(compact["present"][:, x]):
+                    canonical_data.append({
+                        "place_id": place_ids[y],
+                        "num_free": int(compact["num_free"][y, x]) if compact["valid"][y, x] else None,
+                    })
+                yield compact["timestamps"][x].astype(datetime.datetime), canonical_data
+
+    def load_source_series(self, data_source, min_timestamp=None, max_timestamp=None):
+        """
+        Load the canonical data of one source into compact per-place series.
+        Compacted months are copied as whole arrays.
+
+        :param data_source: DataSource instance
+        :return: dict, place_id -> PlaceSeries
+        """
+        builders = dict()
+
+        def _builder(place_id):
+            if place_id not in builders:
+                builders[place_id] = PlaceSeriesBuilder(place_id)
+            return builders[place_id]
+
+        for block_type, *block in self._iter_source_blocks(data_source, min_timestamp, max_timestamp):
+            if block_type == "snapshot":
+                timestamp, canonical_data = block
+                for data in canonical_data:
+                    _builder(data["place_id"]).append(timestamp, data["num_free"])
+                continue
+
+            compact, indices = block
+            for y, place_id in enumerate(compact["place_ids"].tolist()):
+                place_indices = indices[compact["present"][y, indices]]
+                if len(place_indices):
+                    _builder(place_id).extend(
+                        compact["timestamps"][place_indices],
+                        compact["num_free"][y, place_indices],
+                        compact["valid"][y, place_indices],
+                    )
+
+        return {
+            place_id: builder.build()
+            for place_id, builder in builders.items()
+        }
+
+    def load_sources_series(self, sources, min_timestamp=None, max_timestamp=None, processes=None):
+        """
+        Load the canonical data of all sources into compact per-place series
+        :param processes: int, if > 1, load sources in parallel worker processes
+        :return: dict, place_id -> PlaceSeries
+        """
+        source_ids = [attributes["source_id"] for attributes in sources.sources]
+        load_func = partial(_load_source_series, self, min_timestamp, max_timestamp)
+
+        place_id_to_series = dict()
+        if processes and processes > 1:
+            with Pool(processes) as pool:
+                for source_series in tqdm.tqdm(pool.imap(load_func, source_ids), total=len(source_ids)):
+                    place_id_to_series.update(source_series)
+        else:
+            for source_id in tqdm.tqdm(source_ids):
+                place_id_to_series.update(load_func(source_id))
+
+        return place_id_to_series
+
+    def load_sources(self, sources, min_timestamp=None, max_timestamp=None, processes=None):
+        """
+        Load canonical data of all sources
+        :param processes: int, if > 1, load and transform source months in parallel worker processes
+        :return: dict, place_id -> list of {"timestamp": datetime, "num_free": int | None}
+        """
+        if processes and processes > 1:
+            return self._load_sources_parallel(sources, min_timestamp, max_timestamp, processes)
+
+        from .DataSource import DataSources
+
+        place_id_to_timestamps = dict()
+
+        for attributes in tqdm.tqdm(sources.sources):
+            source_id = attributes["source_id"]
+            data_source = DataSources.create(source_id)
+
+            for timestamp, canonical_data in self.iter_source_canonical(
+                    data_source, min_timestamp=min_timestamp, max_timestamp=max_timestamp
+            ):
+                for data in canonical_data:
                     place_id = data["place_id"]
                     if place_id not in place_id_to_timestamps:
                         place_id_to_timestamps[place_id] = []
                     place_id_to_timestamps[place_id].append({
-                        "timestamp": file["timestamp"],
+                        "timestamp": timestamp,
                         "num_free": data["num_free"]
                     })
 
         return place_id_to_timestamps
 
+    def _load_sources_parallel(self, sources, min_timestamp, max_timestamp, processes):
+        tasks = []
+        for attributes in sources.sources:
+            for month in self.find_months(attributes["source_id"], min_timestamp=min_timestamp, max_timestamp=max_timestamp):
+                tasks.append((attributes["source_id"], month))
+
+        place_id_to_timestamps = dict()
+
+        with Pool(processes) as pool:
+            # imap keeps the order of tasks so timestamps stay sorted per place
+            for month_data in tqdm.tqdm(
+                    pool.imap(partial(_load_source_month, self, min_timestamp, max_timestamp), tasks),
+                    total=len(tasks),
+            ):
+                for place_id, timestamps in month_data.items():
+                    if place_id not in place_id_to_timestamps:
+                        place_id_to_timestamps[place_id] = timestamps
+                    else:
+                        place_id_to_timestamps[place_id] += timestamps
+
+        return place_id_to_timestamps
+
+    def find_sources_files_by_day(self, sources, day_func, min_timestamp=None, max_timestamp=None):
+        """
+        Walk the snapshot directories of all sources once and bucket the files by day
+        :param day_func: callable, converts a snapshot timestamp to the bucket key, e.g. a UTC date
+        :return: dict, day -> source_id -> list of file dicts, sorted by timestamp,
+            records in delta storage are represented by one dict per day and month with "delta": True
+        """
+        day_to_files = dict()
+        for attributes in sources.sources:
+            source_id = attributes["source_id"]
+            for month in self.find_months(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp):
+                for file in self._find_month_files(
+                        source_id, month, min_timestamp=min_timestamp, max_timestamp=max_timestamp
+                ):
+                    day = day_func(file["timestamp"])
+                    day_to_files.setdefault(day, dict()).setdefault(source_id, []).append(file)
+
+                day_to_delta_file = dict()
+                for timestamp in self.iter_delta_timestamps(source_id, month, min_timestamp, max_timestamp):
+                    day = day_func(timestamp)
+                    if day not in day_to_delta_file:
+                        day_to_delta_file[day] = {
+                            "filename": self.delta_filename(source_id, month),
+                            "month": month,
+                            "timestamp": timestamp,
+                            "delta": True,
+                            "timestamps": [],
+                        }
+                        day_to_files.setdefault(day, dict()).setdefault(source_id, []).append(day_to_delta_file[day])
+                    day_to_delta_file[day]["timestamps"].append(timestamp)
+
+        for source_id_to_files in day_to_files.values():
+            for files in source_id_to_files.values():
+                files.sort(key=lambda file: file["timestamp"])
+
+        return day_to_files
+
+    def iter_files_canonical(self, source_id_to_files):
+        """
+        Yield canonical data for previously found snapshot files in timestamp order
+        :param source_id_to_files: dict, source_id -> list of file dicts as returned by `find_files`
+        :return: generator of tuple (datetime, source_id, list of dict)
+        """
+        from .DataSource import DataSources
+
+        def _iter_source(source_id, files):
+            data_source = DataSources.create(source_id)
+
+            month_to_files = dict()
+            for file in files:
+                month = file.get("month") or os.path.basename(os.path.dirname(file["filename"]))
+                month_to_files.setdefault(month, []).append(file)
+
+            for month in sorted(month_to_files):
+                month_files = month_to_files[month]
+                for timestamp, canonical_data in heapq.merge(
+                        self._iter_files_canonical(
+                            data_source, month, [file for file in month_files if not file.get("delta")]
+                        ),
+                        *(
+                            self.iter_delta(source_id, month, file["timestamps"][0], file["timestamps"][-1])
+                            for file in month_files if file.get("delta")
+                        ),
+                        key=lambda snapshot: snapshot[0],
+                ):
+                    yield timestamp, source_id, canonical_data
+
+        yield from heapq.merge(
+            *(_iter_source(source_id, files) for source_id, files in source_id_to_files.items()),
+            key=lambda snapshot: snapshot[0],
+        )
+
+    def iter_sources_timestamps(self, sources, min_timestamp=None, max_timestamp=None, processes=None):
+        """
+        Yield the canonical data of one source at a time,
+        so only a single source's history has to be kept in memory
+
+        :param processes: int, if > 1, load sources in parallel worker processes,
+            at most `processes` sources are loaded ahead of the consumer
+        :return: generator of tuple (source_id, dict of place_id -> list of {"timestamp", "num_free"})
+        """
+        source_ids = [attributes["source_id"] for attributes in sources.sources]
+        load_func = partial(_load_source, self, min_timestamp, max_timestamp)
+
+        if processes and processes > 1:
+            with Pool(processes) as pool:
+                pending = deque()
+                for source_id in source_ids:
+                    pending.append((source_id, pool.apply_async(load_func, (source_id, ))))
+                    if len(pending) >= processes:
+                        loaded_source_id, result = pending.popleft()
+                        yield loaded_source_id, result.get()
+                while pending:
+                    loaded_source_id, result = pending.popleft()
+                    yield loaded_source_id, result.get()
+        else:
+            for source_id in source_ids:
+                yield source_id, load_func(source_id)
+
     def load_sources_meta(self, sources, min_timestamp=None, max_timestamp=None):
         from .DataSource import DataSources
 
@@ -188,12 +1135,16 @@ class Storage:
                     data_source._make_places_complete(canonical_data["places"].values())
                 else:
                     snapshot_files = self.find_files(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp)
-                    if not snapshot_files:
+                    # sources stored as delta only keep their latest raw snapshot
+                    latest = self.load_latest_snapshot(source_id)
+                    if snapshot_files and (not latest or snapshot_files[-1]["timestamp"] >= latest[0]):
+                        meta_data = self.load_json(snapshot_files[-1]["filename"])
+                    elif latest:
+                        meta_data = latest[1]
+                    else:
                         raise AssertionError("No meta-data and no snapshot-data stored")
-                    with open(snapshot_files[-1]["filename"]) as fp:
-                        meta_data = json.load(fp)
-                        canonical_data = data_source.transform_meta_data(meta_data)
-                        data_source._make_places_complete(canonical_data["places"].values())
+                    canonical_data = data_source.transform_meta_data(meta_data)
+                    data_source._make_places_complete(canonical_data["places"].values())
 
                 if not canonical_data["places"]:
                     raise AssertionError(f"No places in meta-data for {source_id} "
@@ -206,14 +1157,311 @@ class Storage:
 
         return source_id_to_meta
 
-    def load_sources_arrays(self, sources, min_timestamp=None, max_timestamp=None):
-        place_timestamps = self.load_sources(sources, min_timestamp=min_timestamp, max_timestamp=max_timestamp)
-        place_list = []
-        for place_id in sorted(place_timestamps):
-            timestamps = place_timestamps[place_id]
-            place_list.append({
-                "place_id": place_id,
-                "x": [t["timestamp"] for t in timestamps],
-                "y": [t["num_free"] for t in timestamps],
+    def resampled_filename(self, source_id, interval, month):
+        return os.path.join(self.directories["rollup"], f"{interval}s", source_id, f"{month}.npz")
+
+    def resample_source(self, source_id, interval, min_timestamp=None, max_timestamp=None):
+        """
+        Aggregate the canonical data of a source into regular buckets and store the result
+        per month in the `rollup` directory.
+
+        Months are only recalculated if snapshots newer than the stored result exist.
+
+        :param interval: int, bucket size in seconds, must evenly divide one day
+        :return: int, number of written months
+        """
+        from .DataSource import DataSources
+
+        data_source = DataSources.create(source_id)
+        num_written = 0
+
+        for month in self.find_months(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp):
+            last_timestamp = self.month_last_timestamp(source_id, month)
+            if last_timestamp is None:
+                continue
+
+            filename = self.resampled_filename(source_id, interval, month)
+            if os.path.exists(filename):
+                with np.load(filename) as data:
+                    if data["source_max_timestamp"] >= np.datetime64(last_timestamp, "s"):
+                        continue
+
+            month_start, month_end = self.month_range(month)
+            num_buckets = int((month_end - month_start).total_seconds()) // interval + 1
+            place_id_to_series = self.load_source_series(
+                data_source, min_timestamp=month_start, max_timestamp=month_end
+            )
+            place_ids = sorted(place_id_to_series)
+
+            columns = {
+                key: np.zeros((len(place_ids), num_buckets), dtype=np.int32 if key == "count" else np.float32)
+                for key in ("count", ) + AGGREGATIONS
+            }
+            for y, place_id in enumerate(place_ids):
+                for key, values in resample_series(
+                        place_id_to_series[place_id], interval, np.datetime64(month_start, "s"), num_buckets
+                ).items():
+                    columns[key][y] = values
+
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            np.savez_compressed(
+                filename,
+                source_max_timestamp=np.datetime64(last_timestamp, "s"),
+                timestamps=np.datetime64(month_start, "s") + np.arange(num_buckets) * np.timedelta64(interval, "s"),
+                place_ids=np.array(place_ids, dtype=str),
+                **columns,
+            )
+            num_written += 1
+
+        return num_written
+
+    def resample_sources(self, sources, interval, min_timestamp=None, max_timestamp=None):
+        for attributes in tqdm.tqdm(sources.sources):
+            num_written = self.resample_source(
+                attributes["source_id"], interval, min_timestamp=min_timestamp, max_timestamp=max_timestamp
+            )
+            if num_written:
+                print(f"resampled {num_written} month(s) of {attributes['source_id']}", file=sys.stderr)
+
+    def load_resampled(self, sources, interval, min_timestamp=None, max_timestamp=None):
+        """
+        Load previously stored results of `resample_sources`
+        :return: dict, place_id -> dict
+        {
+            "timestamps": np.ndarray of datetime64[s],  # start of each bucket
+            "count": np.ndarray of int,                 # number of values in bucket
+            "last", "mean", "min", "max": np.ndarray of float
+        }
+        """
+        place_id_to_chunks = dict()
+        for attributes in sources.sources:
+            source_id = attributes["source_id"]
+            for month in self.find_months(source_id, min_timestamp=min_timestamp, max_timestamp=max_timestamp):
+                filename = self.resampled_filename(source_id, interval, month)
+                if not os.path.exists(filename):
+                    continue
+
+                with np.load(filename) as data:
+                    timestamps = data["timestamps"]
+                    selection = np.ones(len(timestamps), dtype=bool)
+                    if min_timestamp:
+                        selection &= timestamps >= np.datetime64(min_timestamp, "s")
+                    if max_timestamp:
+                        selection &= timestamps <= np.datetime64(max_timestamp, "s")
+
+                    for y, place_id in enumerate(data["place_ids"].tolist()):
+                        chunk = {"timestamps": timestamps[selection]}
+                        for key in ("count", ) + AGGREGATIONS:
+                            chunk[key] = data[key][y][selection]
+                        place_id_to_chunks.setdefault(place_id, []).append(chunk)
+
+        return {
+            place_id: {
+                key: np.concatenate([chunk[key] for chunk in chunks])
+                for key in chunks[0]
+            }
+            for place_id, chunks in place_id_to_chunks.items()
+        }
+
+    def daily_rollup_filename(self, source_id):
+        return os.path.join(self.directories["rollup"], "daily", f"{source_id}.json")
+
+    def load_daily_rollup(self, source_id):
+        """
+        Load the incrementally updated rollup table of a source
+        :return: dict
+        {
+            "last_timestamp": str | None,       # iso timestamp of latest included snapshot
+            "places": {
+                place_id: {
+                    "days": {"YYYY-MM-DD": [min, max, sum, count]},
+                    "hour_of_week": [[sum, count], ...]     # 168 entries, monday 0:00 first
+                }
+            }
+        }
+        """
+        try:
+            with open(self.daily_rollup_filename(source_id)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {"last_timestamp": None, "places": dict()}
+
+    def store_daily_rollup(self, source_id, rollup):
+        filename = self.daily_rollup_filename(source_id)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, "w") as fp:
+            json.dump(rollup, fp)
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def _add_to_daily_rollup(cls, rollup, timestamp, canonical_data):
+        """
+        Add one snapshot to the rollup, snapshots older than the latest included one are ignored
+        :return: bool, True if the snapshot was added
+        """
+        iso_timestamp = timestamp.isoformat()
+        if rollup["last_timestamp"] and iso_timestamp <= rollup["last_timestamp"]:
+            return False
+
+        day = timestamp.strftime("%Y-%m-%d")
+        hour_of_week = timestamp.weekday() * 24 + timestamp.hour
+        for data in canonical_data:
+            value = data["num_free"]
+            if value is None:
+                continue
+
+            place = rollup["places"].get(data["place_id"])
+            if place is None:
+                place = rollup["places"][data["place_id"]] = {
+                    "days": dict(),
+                    "hour_of_week": [[0, 0] for i in range(7 * 24)],
+                }
+
+            day_stats = place["days"].get(day)
+            if day_stats is None:
+                place["days"][day] = [value, value, value, 1]
+            else:
+                day_stats[0] = min(day_stats[0], value)
+                day_stats[1] = max(day_stats[1], value)
+                day_stats[2] += value
+                day_stats[3] += 1
+
+            place["hour_of_week"][hour_of_week][0] += value
+            place["hour_of_week"][hour_of_week][1] += 1
+
+        rollup["last_timestamp"] = iso_timestamp
+        return True
+
+    def update_daily_rollup(self, source_id, timestamp, canonical_data):
+        """
+        Add a freshly stored snapshot to the daily rollup table of the source
+        :param canonical_data: list of dict, result of `DataSource.transform_snapshot_data`
+        """
+        rollup = self.load_daily_rollup(source_id)
+        if self._add_to_daily_rollup(rollup, timestamp, canonical_data):
+            self.store_daily_rollup(source_id, rollup)
+
+    def rebuild_daily_rollups(self, sources):
+        """
+        Recalculate the daily rollup tables from the complete history
+        """
+        from .DataSource import DataSources
+
+        for attributes in tqdm.tqdm(sources.sources):
+            rollup = {"last_timestamp": None, "places": dict()}
+            for timestamp, canonical_data in self.iter_source_canonical(DataSources.create(attributes["source_id"])):
+                self._add_to_daily_rollup(rollup, timestamp, canonical_data)
+            self.store_daily_rollup(attributes["source_id"], rollup)
+
+    def load_sources_daily_rollups(self, sources, min_timestamp=None, max_timestamp=None):
+        """
+        Load the daily rollup tables of all sources
+        :return: dict, place_id -> dict
+        {
+            "days": [{"date": str, "min": int, "max": int, "mean": float, "count": int}, ...],
+            "hour_of_week_mean": [float | None, ...]     # 168 entries, monday 0:00 first
+        }
+        """
+        min_day = min_timestamp.strftime("%Y-%m-%d") if min_timestamp else None
+        max_day = max_timestamp.strftime("%Y-%m-%d") if max_timestamp else None
+
+        place_id_to_rollup = dict()
+        for attributes in sources.sources:
+            for place_id, place in self.load_daily_rollup(attributes["source_id"])["places"].items():
+                place_id_to_rollup[place_id] = {
+                    "days": [
+                        {
+                            "date": day,
+                            "min": day_stats[0],
+                            "max": day_stats[1],
+                            "mean": round(day_stats[2] / day_stats[3], 2),
+                            "count": day_stats[3],
+                        }
+                        for day, day_stats in sorted(place["days"].items())
+                        if (not min_day or day >= min_day) and (not max_day or day <= max_day)
+                    ],
+                    "hour_of_week_mean": [
+                        round(value_sum / count, 2) if count else None
+                        for value_sum, count in place["hour_of_week"]
+                    ],
+                }
+
+        return place_id_to_rollup
+
+    def load_sources_arrays(self, sources, min_timestamp=None, max_timestamp=None, processes=None):
+        """
+        :return: list of PlaceSeries, sorted by place_id,
+            which can be accessed like dicts with "place_id", "x" and "y" keys
+        """
+        place_id_to_series = self.load_sources_series(
+            sources, min_timestamp=min_timestamp, max_timestamp=max_timestamp, processes=processes
+        )
+        return [
+            place_id_to_series[place_id]
+            for place_id in sorted(place_id_to_series)
+        ]
+
+
+def _load_source_month(storage, min_timestamp, max_timestamp, task):
+    """
+    Worker function for `Storage.load_sources` in parallel mode.
+    Loads one month of one source.
+    """
+    from .DataSource import DataSources
+
+    source_id, month = task
+    data_source = DataSources.create(source_id)
+    month_start, month_end = storage.month_range(month)
+
+    place_id_to_timestamps = dict()
+    for timestamp, canonical_data in storage.iter_source_canonical(
+            data_source,
+            min_timestamp=max(month_start, min_timestamp) if min_timestamp else month_start,
+            max_timestamp=min(month_end, max_timestamp) if max_timestamp else month_end,
+    ):
+        for data in canonical_data:
+            place_id = data["place_id"]
+            if place_id not in place_id_to_timestamps:
+                place_id_to_timestamps[place_id] = []
+            place_id_to_timestamps[place_id].append({
+                "timestamp": timestamp,
+                "num_free": data["num_free"]
             })
-        return place_list
+
+    return place_id_to_timestamps
+
+
+def _load_source(storage, min_timestamp, max_timestamp, source_id):
+    """
+    Load the canonical data of one source, see `Storage.iter_sources_timestamps`
+    """
+    from .DataSource import DataSources
+
+    data_source = DataSources.create(source_id)
+
+    place_id_to_timestamps = dict()
+    for timestamp, canonical_data in storage.iter_source_canonical(
+            data_source, min_timestamp=min_timestamp, max_timestamp=max_timestamp,
+    ):
+        for data in canonical_data:
+            place_id = data["place_id"]
+            if place_id not in place_id_to_timestamps:
+                place_id_to_timestamps[place_id] = []
+            place_id_to_timestamps[place_id].append({
+                "timestamp": timestamp,
+                "num_free": data["num_free"]
+            })
+
+    return place_id_to_timestamps
+
+
+def _load_source_series(storage, min_timestamp, max_timestamp, source_id):
+    """
+    Load the series of one source, see `Storage.load_sources_series`
+    """
+    from .DataSource import DataSources
+
+    return storage.load_source_series(
+        DataSources.create(source_id), min_timestamp=min_timestamp, max_timestamp=max_timestamp
+    )
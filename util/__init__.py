@@ -1,6 +1,13 @@
 from ._json import JsonEncoder, to_json
 from ._date import to_utc, from_utc
 from ._regex import RegexFilter
-from .DataSource import DataSource, DataSources
+from ._stats import place_series_stats
+from ._resample import parse_interval, resample_series
+from ._http import http_pool_stats
+from .ResponseCache import ResponseCache
+from .DataSource import DataSource, DataSources, ResponseUnchanged
+from .PlaceSeries import PlaceSeries
 from .Storage import Storage
+from .Scheduler import Scheduler, ScheduledJob
 
+from .InfluxWriter import InfluxWriter
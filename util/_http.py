@@ -0,0 +1,168 @@
+import time
+import socket
+import threading
+
+import requests.adapters
+import urllib3.connection
+import urllib3.connectionpool
+
+from . import settings
+
+
+_adapter = None
+_adapter_lock = threading.Lock()
+
+# (host, port) -> (expiry time, address)
+_dns_cache = dict()
+_dns_stats = {"lookups": 0, "hits": 0}
+_dns_lock = threading.Lock()
+
+
+def get_http_adapter():
+    """
+    The process-wide adapter that is mounted on the session of each `DataSource`.
+
+    Sessions keep their own headers and cookies but share the connection pools,
+    so connections to the same host are kept alive and reused across sources.
+    Up to `settings.HTTP_POOL_MAXSIZE` connections per host are opened,
+    further requests wait for a free connection.
+
+    :return: requests.adapters.HTTPAdapter
+    """
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            _adapter = _CachedDNSAdapter(
+                pool_connections=settings.HTTP_POOL_HOSTS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                pool_block=True,
+            )
+        return _adapter
+
+
+def _resolve(host, port):
+    """
+    Look up the address of a host, results are kept for `settings.HTTP_DNS_CACHE_TTL` seconds
+    :return: str, ip address
+    """
+    key = (host, port)
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+        if entry and entry[0] > now:
+            _dns_stats["hits"] += 1
+            return entry[1]
+
+    result = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    address = result[0][4][0]
+
+    with _dns_lock:
+        _dns_stats["lookups"] += 1
+        # drop expired entries
+        for expired_key in [k for k, e in _dns_cache.items() if e[0] <= now]:
+            del _dns_cache[expired_key]
+        _dns_cache[key] = (now + settings.HTTP_DNS_CACHE_TTL, address)
+    return address
+
+
+def _forget(host, port):
+    with _dns_lock:
+        _dns_cache.pop((host, port), None)
+
+
+class _CachedDNSMixin:
+    """
+    Connects to the cached address of the host,
+    the host name is still used for the Host header and TLS verification
+    """
+
+    def _new_conn(self):
+        if not settings.HTTP_DNS_CACHE_TTL:
+            return super()._new_conn()
+
+        dns_host = self._dns_host
+        try:
+            self._dns_host = _resolve(dns_host, self.port)
+        except socket.gaierror:
+            # let urllib3 raise its usual error
+            return super()._new_conn()
+
+        try:
+            return super()._new_conn()
+        except Exception:
+            # the host might have moved, look it up again next time
+            _forget(dns_host, self.port)
+            raise
+        finally:
+            self._dns_host = dns_host
+
+
+class _HTTPConnection(_CachedDNSMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CachedDNSMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _CachedDNSAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter whose connections use the dns cache,
+    other sockets of the process are not affected
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _HTTPConnectionPool,
+            "https": _HTTPSConnectionPool,
+        }
+
+
+def http_pool_stats():
+    """
+    Connection reuse of the shared http adapter
+    :return: dict
+    {
+        "requests": int,        # requests sent
+        "connections": int,     # connections created by the pools
+        "reused": int,          # requests that were sent over an already open connection
+        "dns_lookups": int,
+        "dns_cache_hits": int,
+        "hosts": {
+            "<host>:<port>": {"requests": int, "connections": int},
+        }
+    }
+    """
+    hosts = dict()
+    if _adapter is not None:
+        pools = _adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                host = f"{pool.host}:{pool.port}"
+                if host not in hosts:
+                    hosts[host] = {"requests": 0, "connections": 0}
+                hosts[host]["requests"] += pool.num_requests
+                hosts[host]["connections"] += pool.num_connections
+
+    num_requests = sum(host["requests"] for host in hosts.values())
+    num_connections = sum(host["connections"] for host in hosts.values())
+    with _dns_lock:
+        dns_stats = dict(_dns_stats)
+    return {
+        "requests": num_requests,
+        "connections": num_connections,
+        "reused": max(0, num_requests - num_connections),
+        "dns_lookups": dns_stats["lookups"],
+        "dns_cache_hits": dns_stats["hits"],
+        "hosts": hosts,
+    }
@@ -0,0 +1,71 @@
+import re
+
+import numpy as np
+
+
+AGGREGATIONS = ("last", "mean", "min", "max")
+
+_re_interval = re.compile(r"^(\d+)\s*(s|sec|m|min|h|hour|d|day|)$")
+_UNIT_SECONDS = {
+    "": 1, "s": 1, "sec": 1,
+    "m": 60, "min": 60,
+    "h": 3600, "hour": 3600,
+    "d": 86400, "day": 86400,
+}
+
+
+def parse_interval(interval, divides_day=True):
+    """
+    Convert a string like "5min", "1h", "1d" or "300" (seconds) to seconds.
+    :param divides_day: bool, require the interval to evenly divide one day
+    :return: int
+    """
+    match = _re_interval.match(str(interval).strip())
+    if not match:
+        raise ValueError(f"Invalid interval '{interval}', expected something like '300', '5min', '1h' or '1d'")
+
+    seconds = int(match.groups()[0]) * _UNIT_SECONDS[match.groups()[1]]
+    if not seconds:
+        raise ValueError(f"Interval '{interval}' must not be zero")
+    if divides_day and 86400 % seconds:
+        raise ValueError(f"Interval '{interval}' must evenly divide one day")
+    return seconds
+
+
+def resample_series(series, interval, start, num_buckets):
+    """
+    Aggregate the valid values of a PlaceSeries into regular buckets
+
+    :param series: PlaceSeries
+    :param interval: int, bucket size in seconds
+    :param start: np.datetime64, start of the first bucket
+    :param num_buckets: int
+    :return: dict of np.ndarray of length `num_buckets`
+        "count" is the number of values per bucket, the other aggregations
+        are 0 in buckets with a count of 0
+    """
+    valid = ~np.ma.getmaskarray(series.values)
+    values = series.values.data[valid].astype(np.float64)
+    seconds = (series.timestamps[valid] - np.datetime64(start, "s")).astype(np.int64)
+
+    buckets = seconds // interval
+    in_range = (buckets >= 0) & (buckets < num_buckets)
+    buckets, values = buckets[in_range], values[in_range]
+
+    result = {
+        "count": np.bincount(buckets, minlength=num_buckets).astype(np.int32),
+    }
+    for key in AGGREGATIONS:
+        result[key] = np.zeros(num_buckets, dtype=np.float32)
+
+    if len(buckets):
+        # the series is sorted by time so each bucket is a contiguous range
+        unique_buckets, first_index = np.unique(buckets, return_index=True)
+        last_index = np.append(first_index[1:], len(buckets)) - 1
+
+        result["last"][unique_buckets] = values[last_index]
+        result["min"][unique_buckets] = np.minimum.reduceat(values, first_index)
+        result["max"][unique_buckets] = np.maximum.reduceat(values, first_index)
+        result["mean"][unique_buckets] = np.add.reduceat(values, first_index) / result["count"][unique_buckets]
+
+    return result
@@ -0,0 +1,69 @@
+import datetime
+
+import numpy as np
+
+
+STAT_FUNCTIONS = ("average", "min", "max", "median", "mean", "std", "var")
+PERCENTILES = (5, 25, 75, 95)
+
+
+def place_series_stats(series, num_all=None):
+    """
+    Calculate statistics of a PlaceSeries with numpy
+
+    :param series: PlaceSeries
+    :param num_all: int, optional capacity of the place to calculate the occupancy
+    :return: dict
+    """
+    values = series.values
+    valid = ~np.ma.getmaskarray(values)
+    true_y = values.data[valid].astype(np.int64)
+
+    # a change is a different value or a switch between None and a value
+    num_changes = 0
+    if len(values):
+        changed = (values.data[1:] != values.data[:-1]) | (valid[1:] != valid[:-1])
+        changed &= valid[1:] | valid[:-1]
+        num_changes = 1 + int(np.count_nonzero(changed))
+
+    stats = {
+        "place_id": series.place_id,
+        "num_timestamps": len(series),
+        "num_changes": num_changes,
+        "abs_changes": int(np.abs(np.diff(true_y)).sum()) if len(true_y) else 0,
+        "min_timestamp": series.timestamps[0].astype(datetime.datetime) if len(series) else None,
+        "max_timestamp": series.timestamps[-1].astype(datetime.datetime) if len(series) else None,
+    }
+
+    for key in STAT_FUNCTIONS:
+        stats[key] = round(getattr(np, key)(true_y), 1) if len(true_y) else ""
+
+    for percentile, value in zip(
+            PERCENTILES,
+            np.percentile(true_y, PERCENTILES) if len(true_y) else [""] * len(PERCENTILES)
+    ):
+        stats[f"p{percentile}"] = round(value, 1) if len(true_y) else ""
+
+    stats["num_all"] = num_all
+    stats["occupancy"] = ""
+    if num_all and len(true_y):
+        stats["occupancy"] = round(1. - float(np.mean(true_y)) / num_all, 3)
+
+    valid_timestamps = series.timestamps[valid]
+    hours = valid_timestamps.astype("datetime64[h]").astype(np.int64) % 24
+    # 1970-01-01 was a thursday, monday is 0
+    weekdays = (valid_timestamps.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+    stats["hourly_mean"] = _profile(hours, true_y, 24)
+    stats["weekday_mean"] = _profile(weekdays, true_y, 7)
+
+    return stats
+
+
+def _profile(bins, values, size):
+    counts = np.bincount(bins, minlength=size)
+    sums = np.bincount(bins, weights=values, minlength=size)
+    return [
+        round(float(s / c), 1) if c else None
+        for s, c in zip(sums, counts)
+    ]
@@ -4,3 +4,53 @@ INFLUX_DB_PORT = 8086
 INFLUX_DB_USER = "root"
 INFLUX_DB_PASSWORD = "root"
 INFLUX_DB_NAME = "parking_scraper"
+
+# max number of sources that are downloaded at the same time
+DOWNLOAD_CONCURRENCY = 8
+
+# seconds that responses in ./cache/ are reused with --cache (None = forever),
+# can be set per source with `DataSource.cache_ttl`
+RESPONSE_CACHE_TTL = None
+
+# max total bytes of ./cache/, least recently used responses are removed (0 = no limit)
+RESPONSE_CACHE_MAX_SIZE = 1024 ** 3
+
+# seconds that parsed detail pages of places are reused in meta downloads, 0 to always download,
+# can be set per source with `DataSource.meta_detail_max_age`
+META_DETAIL_MAX_AGE = 7 * 24 * 60 * 60
+
+# max number of simultaneous requests of one source, e.g. for detail pages (see `DataSource.get_urls`)
+SUBREQUEST_CONCURRENCY = 4
+
+# max number of open connections per host, shared by all sources of a process
+HTTP_POOL_MAXSIZE = 4
+
+# max number of hosts whose connections are kept open
+HTTP_POOL_HOSTS = 64
+
+# seconds to remember dns lookups, 0 to disable
+HTTP_DNS_CACHE_TTL = 5 * 60
+
+# keep transformed snapshot data in ./cache-canonical/ to speed up loading
+CANONICAL_CACHE = True
+
+# compression of newly stored snapshots: None, "gzip" or "zstd" (needs the zstandard package)
+SNAPSHOT_COMPRESSION = None
+
+# store snapshots as change-only records of the canonical data in ./snapshots-delta/
+# instead of one raw json file per download, the raw data is not kept then
+SNAPSHOT_DELTA = False
+
+# max seconds between two full records (keyframes) in delta storage,
+# additionally each day starts with a keyframe
+SNAPSHOT_KEYFRAME_INTERVAL = 6 * 60 * 60
+
+# let sources parse only the relevant parts of html pages or use lxml directly,
+# disable to compare with the full BeautifulSoup parsing (see `bench-parse` command)
+FAST_HTML_PARSING = True
+
+# seconds between two snapshots of a source in `daemon` mode
+DAEMON_INTERVAL = 15 * 60
+
+# number of points per write request in `to-influxdb`, also the max number of points held in memory
+INFLUX_BATCH_SIZE = 10000